@@ -0,0 +1,64 @@
+"""
+Seeded synthetic point sets for benchmarks. Every generator returns (n, 3)
+float64 array of x,y in [0, 1) and weights in (0, 1], the same seed and
+size always give the same points.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from collections import OrderedDict
+from pyheatmap.mapcoords import find_area, normalize_batch
+from pyheatmap import pointio
+import numpy as np
+
+POSITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'positions.csv')
+
+#====================================================
+
+def uniform(n, seed):
+    rnd = np.random.RandomState(seed)
+    return np.column_stack((rnd.random_sample((n, 2)), rnd.uniform(0.1, 1.0, n)))
+
+def clustered(n, seed, clusters=20, sigma=0.02):
+    """Gaussian clusters of different size around random centers"""
+    rnd = np.random.RandomState(seed)
+    centers = rnd.uniform(0.1, 0.9, (clusters, 2))
+    share = rnd.dirichlet(np.ones(clusters))
+    which = rnd.choice(clusters, n, p=share)
+    xy = np.clip(centers[which] + rnd.normal(0.0, sigma, (n, 2)), 0.0, np.nextafter(1.0, 0.0))
+    return np.column_stack((xy, rnd.uniform(0.1, 1.0, n)))
+
+def duplicate(n, seed, distinct=0.01):
+    """Points repeating distinct * n locations"""
+    rnd = np.random.RandomState(seed)
+    locations = rnd.random_sample((max(1, int(n * distinct)), 2))
+    return np.column_stack((locations[rnd.randint(0, len(locations), n)], rnd.uniform(0.1, 1.0, n)))
+
+def positions(n, seed):
+    """Bundled resources/positions.csv normalized to its bounds, n is ignored"""
+    points = np.concatenate(list(pointio.read_points([POSITIONS])))
+    normalize_batch(points, find_area([points]))
+    points[:,:2] = np.clip(points[:,:2], 0.0, np.nextafter(1.0, 0.0))
+    return points
+
+DATASETS = OrderedDict([
+    ('uniform', uniform),
+    ('clustered', clustered),
+    ('duplicate', duplicate),
+    ('positions', positions),
+])
+
+# datasets which size does not depend on requested one
+FIXED_SIZE = ('positions',)
+
+def generate(name, n, seed=1):
+    if name not in DATASETS:
+        raise Exception("Unknown dataset '%s'" % (name))
+    return DATASETS[name](n, seed)
+
+def size(name, n):
+    """Number of points generate(name, n) returns"""
+    if name in FIXED_SIZE:
+        return len(generate(name, n))
+    return n
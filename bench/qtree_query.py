@@ -0,0 +1,51 @@
+"""
+Compares QuadTree.query_rect, query_radius and nearest with linear scan of
+QuadTree.items for growing number of points. Query cost should stay almost
+flat while the scan grows linearly.
+
+    python bench/qtree_query.py --sizes=1000,10000,100000
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pyheatmap.partition.qtree import QuadTree
+import argparse
+import random
+import timeit
+
+def scan_rect(qt, rect):
+    x0, y0, x1, y1 = rect
+    return [p for p in qt.items if x0 <= p[0] <= x1 and y0 <= p[1] <= y1]
+
+def main():
+    parser = argparse.ArgumentParser(description='QuadTree query benchmark')
+    parser.add_argument('--sizes', dest="sizes", help="comma separated numbers of points", default='1000,10000,100000')
+    parser.add_argument('--queries', dest="queries", help="number of queries per measurement", default=200, type=int)
+    parser.add_argument('--seed', dest="seed", default=1, type=int)
+    args = parser.parse_args()
+
+    print '%10s %12s %12s %12s %12s %8s' % ('points', 'scan us', 'rect us', 'radius us', 'nearest us', 'speedup')
+    for n in map(int, args.sizes.split(',')):
+        rnd = random.Random(args.seed)
+        qt = QuadTree((0,0,1,1), max_items=32)
+        for _ in range(n):
+            qt.insert((rnd.random(), rnd.random()))
+
+        # fixed size windows returning ~0.01% of the points
+        centers = [(rnd.random(), rnd.random()) for _ in range(args.queries)]
+        rects = [(x - 0.005, y - 0.005, x + 0.005, y + 0.005) for x, y in centers]
+
+        def run(fn, inputs, repeat):
+            t = min(timeit.repeat(lambda: [fn(i) for i in inputs], number=1, repeat=repeat))
+            return t / len(inputs) * 1e6
+
+        scan = run(lambda r: scan_rect(qt, r), rects[:max(1, args.queries // 20)], 1)
+        rect = run(lambda r: list(qt.query_rect(r)), rects, 3)
+        radius = run(lambda c: list(qt.query_radius(c, 0.005)), centers, 3)
+        nearest = run(lambda c: qt.nearest(c, 8), centers, 3)
+
+        print '%10d %12.1f %12.1f %12.1f %12.1f %7.0fx' % (n, scan, rect, radius, nearest, scan / rect)
+
+if __name__ == '__main__':
+    main()
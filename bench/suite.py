@@ -0,0 +1,227 @@
+"""
+Benchmarks partitioning, accumulation and rendering hot paths on seeded
+datasets of growing size (see datasets.py). Every case runs in a separate
+process, so peak memory of one case does not affect the others. Results
+are saved as JSON and can be compared between runs:
+
+    python bench/suite.py --sizes=1000,10000,100000 --out=before.json
+    python bench/suite.py --sizes=1000,10000,100000 --out=after.json
+    python bench/suite.py compare before.json after.json
+
+Per point Python benchmarks are limited to MAX_SIZE points unless
+--no-limit is given, sizes above the limit are skipped. Fixed size
+datasets are checked by their actual number of points.
+"""
+
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from collections import OrderedDict
+from pyheatmap.partition.grid import Grid
+from pyheatmap.partition.qtree import QuadTree
+from pyheatmap.heataccum import HeatGrid, accumulate
+from pyheatmap.heatmap import Heatmap
+import numpy as np
+import subprocess
+import platform
+import resource
+import argparse
+import datetime
+import json
+import math
+import time
+
+import datasets
+
+PALETTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'resources', 'palette.png')
+MAX_SIZE = 100000
+
+#====================================================
+
+def _tuples(points):
+    return [tuple(p) for p in points.tolist()]
+
+def _gridInsert(items):
+    grid = Grid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(100,100))
+    for i in items:
+        grid.insert(i)
+
+def _heatGridInsert(items):
+    grid = HeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(100,100))
+    for i in items:
+        grid.insert(i)
+
+def _qtreeInsert(items):
+    qt = QuadTree((0,0,1,1), lambda x: (x[0],x[1]), max_items=32, max_depth=16)
+    for i in items:
+        qt.insert(i)
+
+def _qtreePrepare(points):
+    items = _tuples(points)
+    return QuadTree.from_items(items, (0,0,1,1), lambda x: (x[0],x[1]), max_items=32, max_depth=16, min_items=8), items
+
+def _qtreeRemove(prepared):
+    qt, items = prepared
+    for i in items:
+        qt.remove(i)
+
+def _render(engine):
+    def run(points):
+        Heatmap().create([points] if engine == 'numpy' else points, PALETTE, size=(800,600), dotsize=35, engine=engine)
+    return run
+
+# name -> (prepare input out of points array, timed function, default size limit)
+BENCHMARKS = OrderedDict([
+    ('grid_insert', (_tuples, _gridInsert, MAX_SIZE)),
+    ('heatgrid_insert', (_tuples, _heatGridInsert, MAX_SIZE)),
+    ('qtree_insert', (_tuples, _qtreeInsert, MAX_SIZE)),
+    ('qtree_remove', (_qtreePrepare, _qtreeRemove, MAX_SIZE)),
+    ('accumulate', (lambda p: p, lambda p: accumulate([p], cells_num=(100,100)), None)),
+    ('render_numpy', (lambda p: p, _render('numpy'), None)),
+    ('render_pil', (_tuples, _render('pil'), MAX_SIZE // 10)),
+])
+
+#====================================================
+
+def peakRss():
+    """Peak resident memory of the current process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on OS X, kilobytes elsewhere
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+def runCase(bench, dataset, size, seed, repeat):
+    """Measures single case in the current process, returns result dict"""
+    prepare, run, _ = BENCHMARKS[bench]
+    points = datasets.generate(dataset, size, seed)
+    base_rss = peakRss()
+
+    best = None
+    for _ in range(repeat):
+        data = prepare(points)
+        start = time.time()
+        run(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+        del data
+
+    return { 'bench' : bench, 'dataset' : dataset, 'size' : len(points), 'seconds' : best,
+             'rate' : len(points) / best if best else None,
+             'peak_rss_mb' : peakRss(), 'base_rss_mb' : base_rss }
+
+def spawnCase(bench, dataset, size, seed, repeat, timeout):
+    """Runs case in child process, returns result dict or None on failure or timeout"""
+    cmd = [sys.executable, os.path.abspath(__file__), 'case', bench, dataset, str(size), str(seed), str(repeat)]
+    child = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    deadline = time.time() + timeout
+    while child.poll() is None:
+        if time.time() > deadline:
+            child.kill()
+            child.wait()
+            sys.stderr.write("%s/%s/%d timed out\n" % (bench, dataset, size))
+            return None
+        time.sleep(0.05)
+
+    out = child.stdout.read()
+    if child.returncode:
+        sys.stderr.write("%s/%s/%d failed\n" % (bench, dataset, size))
+        return None
+    return json.loads(out)
+
+def scaling(results):
+    """Yields (result, exponent) where exponent is log-log slope of time from the previous size"""
+    prev = None
+    for r in results:
+        exp = None
+        if prev and r['size'] > prev['size'] and prev['seconds'] and r['seconds']:
+            exp = math.log(r['seconds'] / prev['seconds']) / math.log(float(r['size']) / prev['size'])
+        yield r, exp
+        prev = r
+
+def report(results):
+    print '%-16s %-10s %10s %10s %12s %9s %9s %6s' % ('bench', 'dataset', 'points', 'seconds', 'points/s', 'peak MB', 'delta MB', 'scale')
+    groups = OrderedDict()
+    for r in results:
+        groups.setdefault((r['bench'], r['dataset']), []).append(r)
+
+    for group in groups.values():
+        for r, exp in scaling(sorted(group, key=lambda r: r['size'])):
+            print '%-16s %-10s %10d %10.4f %12.0f %9.1f %9.1f %6s' % (r['bench'], r['dataset'], r['size'], r['seconds'],
+                r['rate'] or 0, r['peak_rss_mb'], r['peak_rss_mb'] - r['base_rss_mb'], '%.2f' % exp if exp is not None else '-')
+
+def compare(base, new, threshold):
+    """Prints time and memory ratios of matching cases, returns number of regressions"""
+    key = lambda r: (r['bench'], r['dataset'], r['size'])
+    before = dict((key(r), r) for r in base['results'])
+
+    regressions = 0
+    print '%-16s %-10s %10s %10s %10s %7s %7s' % ('bench', 'dataset', 'points', 'base s', 'new s', 'time', 'memory')
+    for r in new['results']:
+        b = before.get(key(r))
+        if not b:
+            continue
+        t = r['seconds'] / b['seconds'] if b['seconds'] else float('nan')
+        m = (r['peak_rss_mb'] - r['base_rss_mb'] + 1.0) / (b['peak_rss_mb'] - b['base_rss_mb'] + 1.0)
+        mark = ''
+        if t > 1.0 + threshold or m > 1.0 + threshold:
+            mark = 'slower' if t > 1.0 + threshold else 'bigger'
+            regressions += 1
+        elif t < 1.0 - threshold:
+            mark = 'faster'
+        print '%-16s %-10s %10d %10.4f %10.4f %6.2fx %6.2fx %s' % (r['bench'], r['dataset'], r['size'], b['seconds'], r['seconds'], t, m, mark)
+    return regressions
+
+#====================================================
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'case':
+        bench, dataset, size, seed, repeat = sys.argv[2:7]
+        print json.dumps(runCase(bench, dataset, int(size), int(seed), int(repeat)))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        parser = argparse.ArgumentParser(prog='suite.py compare', description='Compares two benchmark results')
+        parser.add_argument('--threshold', dest="threshold", help="relative change reported as regression", type=float, default=0.1)
+        parser.add_argument('base', help="results of the base run")
+        parser.add_argument('new', help="results of the new run")
+        args = parser.parse_args(sys.argv[2:])
+
+        with open(args.base) as b, open(args.new) as n:
+            regressions = compare(json.load(b), json.load(n), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    parser = argparse.ArgumentParser(description='Partitioning, accumulation and rendering benchmarks')
+    parser.add_argument('--bench', dest="bench", help="comma separated benchmarks (%s)" % (','.join(BENCHMARKS)), default=','.join(BENCHMARKS))
+    parser.add_argument('--datasets', dest="datasets", help="comma separated datasets (%s)" % (','.join(datasets.DATASETS)), default=','.join(datasets.DATASETS))
+    parser.add_argument('--sizes', dest="sizes", help="comma separated numbers of points", default='1000,10000,100000,1000000,10000000')
+    parser.add_argument('--no-limit', dest="no_limit", help="run per point benchmarks above %d points" % (MAX_SIZE), action='store_true')
+    parser.add_argument('--repeat', dest="repeat", help="number of runs of each case, the best time is reported", type=int, default=3)
+    parser.add_argument('--seed', dest="seed", type=int, default=1)
+    parser.add_argument('--timeout', dest="timeout", help="seconds after which a case is stopped", type=float, default=600.0)
+    parser.add_argument('--out', dest="out", help="JSON results file", default='bench_results.json')
+    args = parser.parse_args()
+
+    sizes = [int(float(s)) for s in args.sizes.split(',')]
+    results = []
+    for bench in args.bench.split(','):
+        if bench not in BENCHMARKS:
+            raise Exception("Unknown benchmark '%s'" % (bench))
+        limit = None if args.no_limit else BENCHMARKS[bench][2]
+
+        for dataset in args.datasets.split(','):
+            for size in (sizes[:1] if dataset in datasets.FIXED_SIZE else sizes):
+                if limit and datasets.size(dataset, size) > limit:
+                    continue
+                r = spawnCase(bench, dataset, size, args.seed, args.repeat, args.timeout)
+                if r:
+                    results.append(r)
+                    sys.stderr.write("%s/%s/%d: %.4fs\n" % (bench, dataset, r['size'], r['seconds']))
+
+    meta = { 'date' : datetime.datetime.now().isoformat(), 'python' : platform.python_version(),
+             'numpy' : np.__version__, 'platform' : platform.platform(), 'seed' : args.seed, 'repeat' : args.repeat }
+    with open(args.out, 'w') as f:
+        json.dump({ 'meta' : meta, 'results' : results }, f, indent=1, sort_keys=True)
+
+    report(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+from pyheatmap.pipeline import main
+
+main()
@@ -0,0 +1,143 @@
+from PIL import Image
+from heatmap import LiveHeatmap
+import numpy as np
+import math
+import os
+
+import kernels
+import pointio
+
+#====================================================
+
+class Animator(object):
+    MODES = ('window', 'cumulative', 'decay')
+
+    def __init__(self, points, palette, size=None, dotsize=150, opacity=0.9, background=None,
+                 kernel='linear', falloff=1.0):
+        """
+        Renders frames of heat map changing over time
+        points     -> iterable of normalized (x,y,w,t) points or point arrays
+        other parameters are the same as of Heatmap.create, palette, dot
+        and background are prepared once for all frames
+        """
+        batches = list(pointio.batches(points, ncols=4))
+        points = np.concatenate(batches) if batches else np.zeros((0, 4))
+        if np.isnan(points[:, 3]).any():
+            raise Exception("All points should have timestamps")
+
+        order = np.argsort(points[:, 3], kind='mergesort')
+        self.points = points[order]
+        self.times = self.points[:, 3]
+
+        self._params = dict(palette=palette, size=size, dotsize=dotsize, opacity=opacity,
+                            background=background, kernel=kernel, falloff=falloff)
+
+    def frames(self, interval, mode='window', window=None, half_life=None, start=None, end=None):
+        """
+        Yields (time, image) frames ending every interval time units from
+        start to end (time range of points by default). Each frame is built
+        from the previous one:
+        'window'     -> points within window (interval by default) before
+                        the end of frame, leaving points are removed
+        'cumulative' -> all points before the end of frame
+        'decay'      -> all points before the end of frame, weights fade by
+                        half every half_life (interval by default)
+        The same image object is updated for every frame
+        """
+        if mode not in self.MODES:
+            raise Exception("Unknown animation mode '%s'" % (mode))
+        if interval <= 0:
+            raise Exception("Frame interval should be positive")
+        if not len(self.times) and (start is None or end is None):
+            return
+
+        start = self.times[0] if start is None else start
+        end = self.times[-1] if end is None else end
+        window = window or interval
+        half_life = half_life or interval
+
+        dtype = np.float64 if mode == 'decay' else np.int32
+        live = LiveHeatmap(dtype=dtype, **self._params)
+
+        added = removed = 0
+        for k in range(int(math.floor((end - start) / interval)) + 1):
+            t = start + (k + 1) * interval
+            upto = np.searchsorted(self.times, t, 'left')
+            fresh = self.points[added:upto, :3]
+
+            if mode == 'decay':
+                live.fade(0.5 ** (float(interval) / half_life))
+                fresh = fresh.copy()
+                fresh[:, 2] *= 0.5 ** ((t - self.times[added:upto]) / half_life)
+            live.add_points([fresh])
+            added = upto
+
+            if mode == 'window':
+                since = np.searchsorted(self.times, t - window, 'left')
+                live.remove_points([self.points[removed:since, :3]])
+                removed = since
+
+            yield t, live.render()
+
+    def save(self, out, interval, duration=100, **kwargs):
+        """
+        Writes frames into numbered files if out has %d placeholder
+        (e.g. frames/%05d.png), or into animated GIF or PNG file showing
+        each frame for duration ms, returns number of frames
+        """
+        frames = self.frames(interval, **kwargs)
+        if '%' in out:
+            path = os.path.dirname(out)
+            if path and not os.path.isdir(path):
+                os.makedirs(path)
+            n = 0
+            for n, (_, img) in enumerate(frames, 1):
+                img.save(out % (n - 1))
+            return n
+
+        fmt = os.path.splitext(out)[1][1:].upper()
+        Image.init()
+        if fmt not in Image.SAVE_ALL:
+            raise Exception("Animated %s is not supported by installed PIL" % (fmt))
+
+        images = [img.copy() for _, img in frames]
+        if images:
+            images[0].save(out, fmt, save_all=True, append_images=images[1:], duration=duration, loop=0)
+        return len(images)
+
+#====================================================
+
+if __name__ == '__main__':
+    import sys, argparse
+
+    parser = argparse.ArgumentParser(description='Renders heat map animation from CSV or binary "x,y,weight,time" points')
+    parser.add_argument('--palette', dest="palette", help="palette file for color mapping", default='resources/palette.png')
+    parser.add_argument('--bg', dest="background", help="background file name")
+    parser.add_argument('--size', dest="size", help="size of image h,w if not using background", default="800,600")
+    parser.add_argument('--dotsize', dest="dotsize", help="size of the heat dot", default=100, type=int)
+    parser.add_argument('--opacity', dest="opacity", help="opacity of the heat layer", default=0.9, type=float)
+    parser.add_argument('--kernel', dest="kernel", help="shape of the heat dot", choices=kernels.SHAPES, default='linear')
+    parser.add_argument('--falloff', dest="falloff", help="relative radius at which dot strength reaches zero", default=1.0, type=float)
+    parser.add_argument('--interval', dest="interval", help="time between frames", type=float, required=True)
+    parser.add_argument('--mode', dest="mode", help="how points of previous frames are kept", choices=Animator.MODES, default='window')
+    parser.add_argument('--window', dest="window", help="time span of points shown in window mode (interval by default)", type=float, default=None)
+    parser.add_argument('--half-life', dest="half_life", help="half life of point weights in decay mode (interval by default)", type=float, default=None)
+    parser.add_argument('--start', dest="start", help="time of the first frame start", type=float, default=None)
+    parser.add_argument('--end', dest="end", help="time of the last frame start", type=float, default=None)
+    parser.add_argument('--duration', dest="duration", help="frame duration of animated image in ms", type=int, default=100)
+    parser.add_argument('--out', dest="output", help="animated .gif file or frame file pattern with %%d", default="frames/%05d.png")
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
+
+    args = parser.parse_args()
+    size = tuple(map(int, args.size.split(',')))
+    background = Image.open(args.background) if args.background else None
+
+    points = pointio.read_points(args.file, ncols=4, min_cols=4)
+
+    try:
+        animator = Animator(points, args.palette, size=size, dotsize=args.dotsize, opacity=args.opacity,
+                            background=background, kernel=args.kernel, falloff=args.falloff)
+        animator.save(args.output, args.interval, duration=args.duration, mode=args.mode,
+                      window=args.window, half_life=args.half_life, start=args.start, end=args.end)
+    except KeyboardInterrupt:
+        pass
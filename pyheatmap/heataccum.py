@@ -1,12 +1,26 @@
-from partition.grid import Grid
+from partition.grid import Grid, GridCell
+from partition.rect import Rect
+import numpy as np
+import multiprocessing
+import heapq
+import math
+import time
 import sys
 
+import pointio
+import stats
+
+# grids with more cells are sparse by default
+SPARSE_CELLS = 1 << 22
+
 #====================================================
 
 class HeatGrid(Grid):
     def insert(self, item):
+        # callers time the insertion loop, stage per point costs more than inserting it
         where = Grid.insert(self, item)
         if where:
+            stats.count('cells_touched')
             cell = self[where]
             merged = self.mergeItems(cell.items)
             cell.clear()
@@ -25,55 +39,744 @@ class HeatGrid(Grid):
 
 #====================================================
 
+class ArrayHeatGrid(Grid):
+    """HeatGrid that keeps running sums of x*w, y*w and w of every cell
+    in (ny, nx, 3) array. Sparse grid keeps sums of occupied cells only,
+    sorted by flat cell index cy * nx + cx"""
+    
+    # sparse grid merges staged batches when they reach this number of cells
+    # or the number of occupied cells, whichever is bigger
+    SPARSE_STAGE = 1 << 20
+    
+    # version of saved state files
+    STATE_VERSION = 1
+    
+    @property
+    def cells(self):
+        """Yields cells holding merged (x, y, w) item like HeatGrid cells do,
+        cells are built from the sums and changing them does not affect the grid"""
+        nx, ny = self.dimensions
+        keys, sums = self.cellSums()
+        merged = dict(zip(keys.tolist(), self._merged(sums)))
+        flat = keys.tolist() if self.sparse else xrange(nx * ny)
+        return (self._cell(k % nx, k // nx, merged.get(k)) for k in flat)
+    
+    @property
+    def items(self):
+        return self._merged(self.cellSums()[1])
+    
+    @property
+    def count(self):
+        return len(self.cellSums()[0])
+    
+    def __getitem__(self, xy):
+        cx, cy = xy
+        sums = self._cellSum(cy * self.dimensions[0] + cx)
+        if sums is None or not sums[2]:
+            return self._cell(cx, cy, None)
+        return self._cell(cx, cy, self._merged(sums[None])[0])
+    
+    def query_rect(self, rect):
+        """Yields merged items of cells which coordinates fall into rect (x0,y0,x1,y1)"""
+        x0, y0, x1, y1 = Rect(rect)
+        keys, sums = self.cellSums()
+        X, Y = sums[:,0] / sums[:,2], sums[:,1] / sums[:,2]
+        inside = (X >= x0) & (X <= x1) & (Y >= y0) & (Y <= y1)
+        for i in self._merged(sums[inside]):
+            yield i
+    
+    def normalizedPoints(self):
+        """Returns (n, 3) array of cell points with weights divided by the maximal one"""
+        keys, sums = self.cellSums()
+        W = sums[:,2]
+        if not len(W):
+            return np.zeros((0, 3))
+        return np.column_stack((sums[:,0] / W, sums[:,1] / W, W / W.max()))
+    
+    def cellSums(self):
+        """Returns flat indices of occupied cells and (n, 3) array of their sums"""
+        if self.sparse:
+            self._flush()
+            return self._cells
+        
+        sums = self._cells.reshape(-1, 3)
+        keys = np.nonzero(sums[:,2])[0]
+        return keys, sums[keys]
+    
+    def addCellSums(self, keys, sums):
+        """Adds (n, 3) sums to cells with given flat indices"""
+        if not self.sparse:
+            nx, ny = self.dimensions
+            flat = self._cells.reshape(-1, 3)
+            for c in range(3):
+                flat[:,c] += np.bincount(keys, weights=sums[:,c], minlength=nx * ny)
+            return
+        
+        self._stage.append((keys, sums))
+        self._staged += len(keys)
+        if self._staged >= max(self.SPARSE_STAGE, len(self._cells[0])):
+            self._flush()
+    
+    def insert(self, item):
+        x, y = self._getcoord(item)[:2]
+        w = item[2] if len(item) > 2 else 1.0
+        
+        nx, ny = self.dimensions
+        cx = int((x - self.area[0]) / self.area.width * nx)
+        cy = int((y - self.area[1]) / self.area.height * ny)
+        
+        if cx < 0 or cx >= nx or cy < 0 or cy >= ny:
+            return None
+        
+        stats.count('cells_touched')
+        if self.sparse:
+            self.addCellSums(np.array([cy * nx + cx]), np.array([[x * w, y * w, w]]))
+        else:
+            cell = self._cells[cy, cx]
+            cell[0] += x * w
+            cell[1] += y * w
+            cell[2] += w
+        return (cx, cy)
+    
+    def insert_many(self, xs, ys, ws):
+        """Accumulates arrays of points, returns number of accepted points"""
+        idx, inside = self._cellIndices(xs, ys)
+        if inside is not None:
+            xs, ys, ws = xs[inside], ys[inside], ws[inside]
+        
+        # cells are counted on insertion only, merging sums does not touch new points
+        if self.sparse:
+            keys, sums = _groupSums(idx, (xs * ws, ys * ws, ws))
+            stats.count('cells_touched', len(keys))
+            self.addCellSums(keys, sums)
+        else:
+            if stats.enabled():
+                stats.count('cells_touched', len(np.unique(idx)))
+            self.addCellSums(idx, np.column_stack((xs * ws, ys * ws, ws)))
+        return len(idx)
+    
+    def _cellIndices(self, xs, ys):
+        # flat cell indices of points inside the grid and the mask of
+        # these points, the mask is None when all points are inside
+        nx, ny = self.dimensions
+        cx = ((xs - self.area[0]) / self.area.width * nx).astype(np.int64)
+        cy = ((ys - self.area[1]) / self.area.height * ny).astype(np.int64)
+        
+        inside = (cx >= 0) & (cx < nx) & (cy >= 0) & (cy < ny)
+        if inside.all():
+            return cy * nx + cx, None
+        return cy[inside] * nx + cx[inside], inside
+    
+    def remove(self, item):
+        raise Exception('Items can not be removed from accumulated grid')
+    
+    def _cellSum(self, key):
+        # (3,) sums of the cell with flat index key or None, sparse grid
+        # looks it up in sorted keys once staged sums are merged
+        if not self.sparse:
+            return self._cells.reshape(-1, 3)[key]
+        
+        self._flush()
+        keys, sums = self._cells
+        i = np.searchsorted(keys, key)
+        return sums[i] if i < len(keys) and keys[i] == key else None
+    
+    def _merged(self, sums):
+        X, Y, W = sums[:,0], sums[:,1], sums[:,2]
+        return zip((X / W).tolist(), (Y / W).tolist(), W.tolist())
+    
+    def _cell(self, cx, cy, item):
+        cell = GridCell(self, (cx, cy))
+        if item is not None:
+            cell.insert(item)
+        return cell
+    
+    def saveState(self, fname):
+        """Saves un-normalized sums of occupied cells, grid area and dimensions into .npz file"""
+        keys, sums = self.cellSums()
+        with open(fname, 'wb') as f:
+            np.savez_compressed(f, version=self.STATE_VERSION, area=tuple(self.area),
+                                dims=self.dimensions, keys=keys, sums=sums)
+    
+    def mergeState(self, fname):
+        """Adds sums saved by saveState, the state must have the same area and dimensions"""
+        area, dims, keys, sums = self._readState(fname)
+        if area != tuple(self.area) or dims != self.dimensions:
+            raise Exception("State %s has area %s and grid %s instead of %s and %s"
+                            % (fname, area, dims, tuple(self.area), self.dimensions))
+        self.addCellSums(keys, sums)
+    
+    @classmethod
+    def loadState(cls, fname, sparse=None):
+        """Creates grid from state saved by saveState"""
+        area, dims, _, _ = cls._readState(fname)
+        grid = _createGrid(area, dims, None, sparse)
+        grid.mergeState(fname)
+        return grid
+    
+    @classmethod
+    def _readState(cls, fname):
+        with np.load(fname) as data:
+            if int(data['version']) != cls.STATE_VERSION:
+                raise Exception("Unsupported state version %s in %s" % (data['version'], fname))
+            area = tuple(data['area'].tolist())
+            dims = tuple(data['dims'].tolist())
+            return area, dims, data['keys'], data['sums']
+    
+    def _flush(self):
+        if not self._stage:
+            return
+        
+        keys = np.concatenate([self._cells[0]] + [k for k, _ in self._stage])
+        sums = np.concatenate([self._cells[1]] + [s for _, s in self._stage])
+        self._stage = []
+        self._staged = 0
+        
+        keys, merged = _groupSums(keys, sums.T)
+        occupied = merged[:,2] != 0
+        self._cells = (keys[occupied], merged[occupied])
+    
+    def _createGridFromNum(self, cells_num):
+        cn = self._cellsNum(cells_num)
+        if self.sparse:
+            self._dims = cn
+            self._stage = []
+            self._staged = 0
+            return (np.zeros(0, np.int64), np.zeros((0, 3)))
+        return np.zeros((cn[1], cn[0], 3))
+
+#====================================================
+
+class TimedHeatGrid(ArrayHeatGrid):
+    """Base of dense grids which cells heat depends on time of points.
+    Points are (x, y[, w[, t]]), missing or NaN timestamps are replaced with
+    the current time. now is the latest time seen by the grid"""
+    
+    def __init__(self, area, getcoord = lambda x: x, cell_size=None, cells_num=None):
+        ArrayHeatGrid.__init__(self, area, getcoord, cell_size=cell_size, cells_num=cells_num)
+    
+    @property
+    def dimensions(self):
+        return self._dims
+    
+    @property
+    def items(self):
+        return self.snapshot()
+    
+    def snapshot(self, at=None):
+        """Returns list of (x, y, w) cell points as of time at (now by default)"""
+        keys, sums = self.cellSums(at)
+        X, Y, W = sums[:,0], sums[:,1], sums[:,2]
+        return zip((X / W).tolist(), (Y / W).tolist(), W.tolist())
+    
+    def normalizedPoints(self, at=None):
+        keys, sums = self.cellSums(at)
+        W = sums[:,2]
+        if not len(W):
+            return np.zeros((0, 3))
+        return np.column_stack((sums[:,0] / W, sums[:,1] / W, W / W.max()))
+    
+    def insert(self, item):
+        x, y = self._getcoord(item)[:2]
+        w = item[2] if len(item) > 2 else 1.0
+        ts = np.array([item[3]]) if len(item) > 3 else None
+        
+        idx, inside = self._cellIndices(np.array([x]), np.array([y]))
+        if inside is not None or not self.insert_many(np.array([x]), np.array([y]), np.array([w]), ts):
+            return None
+        return (int(idx[0] % self.dimensions[0]), int(idx[0] // self.dimensions[0]))
+    
+    def addCellSums(self, keys, sums):
+        raise Exception('Sums without timestamps can not be added to %s' % (type(self).__name__))
+    
+    def _timestamps(self, ts, n):
+        if ts is None:
+            return np.repeat(time.time(), n)
+        unknown = np.isnan(ts)
+        if unknown.any():
+            ts = np.where(unknown, time.time(), ts)
+        return ts
+    
+    def _advance(self, at):
+        # stream time only moves forward, late points do not move it back
+        if at is not None and (self.now is None or at > self.now):
+            self.now = at
+        return self.now
+    
+    def _snapshotTime(self, at):
+        if at is not None and self.now is not None and at < self.now:
+            raise Exception('Snapshot time %g precedes the time of the latest point %g' % (at, self.now))
+        return self._advance(at)
+
+#====================================================
+
+class DecayHeatGrid(TimedHeatGrid):
+    def __init__(self, area, getcoord = lambda x: x, cell_size=None, cells_num=None, half_life=60.0):
+        """Grid which point weights fade by half every half_life time units.
+        Cell sums are kept as of the time of the last cell update and are
+        rescaled lazily when the cell receives new points or on snapshot"""
+        
+        if half_life <= 0:
+            raise Exception('Half life should be positive')
+        self.half_life = float(half_life)
+        self.rate = math.log(2.0) / self.half_life
+        TimedHeatGrid.__init__(self, area, getcoord, cell_size, cells_num)
+    
+    def cellSums(self, at=None):
+        """Returns flat indices of occupied cells and their sums decayed to time at,
+        which can not precede the time of the latest point"""
+        at = self._snapshotTime(at)
+        flat = self._cells.reshape(-1, 3)
+        keys = np.nonzero(flat[:,2])[0]
+        sums = flat[keys] * np.exp(-self.rate * (at - self._time[keys]))[:,None]
+        
+        # weights of long forgotten cells underflow to zero
+        occupied = sums[:,2] != 0
+        return keys[occupied], sums[occupied]
+    
+    def _cellSum(self, key):
+        if self.now is None:
+            return None
+        return self._cells.reshape(-1, 3)[key] * math.exp(-self.rate * (self.now - self._time[key]))
+    
+    def insert_many(self, xs, ys, ws, ts=None):
+        """Accumulates arrays of points, returns number of accepted points"""
+        ts = self._timestamps(ts, len(xs))
+        idx, inside = self._cellIndices(xs, ys)
+        if inside is not None:
+            xs, ys, ws, ts = xs[inside], ys[inside], ws[inside], ts[inside]
+        if not len(idx):
+            return 0
+        
+        now = self._advance(ts.max())
+        ws = ws * np.exp(-self.rate * (now - ts))
+        keys, sums = _groupSums(idx, (xs * ws, ys * ws, ws))
+        
+        stats.count('cells_touched', len(keys))
+        flat = self._cells.reshape(-1, 3)
+        flat[keys] = flat[keys] * np.exp(-self.rate * (now - self._time[keys]))[:,None] + sums
+        self._time[keys] = now
+        return len(idx)
+    
+    def _createGridFromNum(self, cells_num):
+        cn = self._cellsNum(cells_num)
+        self._dims = cn
+        self._time = np.zeros(cn[0] * cn[1])
+        self.now = None
+        return np.zeros((cn[1], cn[0], 3))
+
+#====================================================
+
+class WindowHeatGrid(TimedHeatGrid):
+    def __init__(self, area, getcoord = lambda x: x, cell_size=None, cells_num=None, window=60.0, buckets=60):
+        """Grid which sums weights of points within sliding time window.
+        Every cell has a ring of buckets each covering window / buckets time
+        units, buckets leaving the window are reused for new points, so
+        window boundary moves with bucket precision"""
+        
+        if window <= 0 or buckets <= 0:
+            raise Exception('Window and number of buckets should be positive')
+        self.window = float(window)
+        self.buckets = int(buckets)
+        self.bucket_time = self.window / self.buckets
+        TimedHeatGrid.__init__(self, area, getcoord, cell_size, cells_num)
+    
+    def cellSums(self, at=None):
+        """Returns flat indices of occupied cells and their sums within the window
+        ending at time at, which can not precede the time of the latest point"""
+        at = self._snapshotTime(at)
+        if at is None:
+            return np.zeros(0, np.int64), np.zeros((0, 3))
+        
+        head = int(math.floor(at / self.bucket_time))
+        live = self._ids > head - self.buckets
+        sums = self._ring[live].sum(axis=0)
+        keys = np.nonzero(sums[:,2])[0]
+        return keys, sums[keys]
+    
+    def _cellSum(self, key):
+        if self.now is None:
+            return None
+        head = int(math.floor(self.now / self.bucket_time))
+        return self._ring[self._ids > head - self.buckets, key].sum(axis=0)
+    
+    def insert_many(self, xs, ys, ws, ts=None):
+        """Accumulates arrays of points, returns number of accepted points,
+        points older than the window are skipped"""
+        ts = self._timestamps(ts, len(xs))
+        idx, inside = self._cellIndices(xs, ys)
+        if inside is not None:
+            xs, ys, ws, ts = xs[inside], ys[inside], ws[inside], ts[inside]
+        if not len(idx):
+            return 0
+        
+        head = int(math.floor(self._advance(ts.max()) / self.bucket_time))
+        bucket = np.floor(ts / self.bucket_time).astype(np.int64)
+        recent = bucket > head - self.buckets
+        if not recent.all():
+            xs, ys, ws, idx, bucket = xs[recent], ys[recent], ws[recent], idx[recent], bucket[recent]
+        
+        # ring slots still holding expired buckets are cleared before reuse
+        for b in np.unique(bucket).tolist():
+            slot = b % self.buckets
+            if self._ids[slot] != b:
+                self._ring[slot] = 0
+                self._ids[slot] = b
+        
+        cells = self._ring.shape[1]
+        keys, sums = _groupSums((bucket % self.buckets) * cells + idx, (xs * ws, ys * ws, ws))
+        stats.count('cells_touched', len(keys))
+        self._ring.reshape(-1, 3)[keys] += sums
+        return len(idx)
+    
+    def _createGridFromNum(self, cells_num):
+        cn = self._cellsNum(cells_num)
+        self._dims = cn
+        self._ring = np.zeros((self.buckets, cn[0] * cn[1], 3))
+        self._ids = np.repeat(np.iinfo(np.int64).min, self.buckets)
+        self.now = None
+        return self._ring
+
+#====================================================
+
+def accumulate(batches, area=(0.0, 0.0, 1.0, 1.0), cells_num=None, cell_size=None, sparse=None):
+    """
+    Accumulates stream of (n, 3) point arrays into ArrayHeatGrid, grid is
+    sparse when it has more than SPARSE_CELLS cells unless sparse is given
+    """
+    grid = _createGrid(area, cells_num, cell_size, sparse)
+    for block in stats.iterate('read', batches):
+        with stats.stage('insert'):
+            grid.insert_many(block[:,0], block[:,1], block[:,2])
+    return grid
+
+def accumulateFiles(filenames, area=(0.0, 0.0, 1.0, 1.0), cells_num=None, cell_size=None, sparse=None, workers=1):
+    """
+    Accumulates points of CSV or binary files split into shards, every
+    shard is collected into partial grid by one of the worker processes
+    and partial sums are merged in the order of shards. Shards do not
+    depend on number of workers, so the result is the same for any of them
+    """
+    grid = _createGrid(area, cells_num, cell_size, sparse)
+    shards = list(pointio.shards(filenames))
+    
+    if workers > 1 and len(shards) > 1:
+        # workers return their stats to be merged into the stats of this process
+        collect = stats.enabled()
+        jobs = [(shard, area, cells_num, cell_size, grid.sparse, collect) for shard in shards]
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        try:
+            for keys, sums, report in pool.imap(_accumulateShard, jobs):
+                stats.merge(report)
+                with stats.stage('merge'):
+                    grid.addCellSums(keys, sums)
+        finally:
+            pool.terminate()
+    else:
+        for shard in shards:
+            keys, sums, _ = _accumulateShard((shard, area, cells_num, cell_size, grid.sparse, False))
+            with stats.stage('merge'):
+                grid.addCellSums(keys, sums)
+    
+    return grid
+
+def mergeStates(fnames, sparse=None):
+    """Merges grid states saved by ArrayHeatGrid.saveState"""
+    grid = ArrayHeatGrid.loadState(fnames[0], sparse)
+    for fname in fnames[1:]:
+        grid.mergeState(fname)
+    return grid
+
+def buildPyramid(grid, levels):
+    """
+    Returns list of (dims, keys, sums) accumulation levels, the first one
+    is the grid itself and every next level halves its resolution summing
+    2x2 blocks of cells. Grid dimensions should be divisible by 2^(levels-1)
+    """
+    nx, ny = grid.dimensions
+    scale = 1 << (levels - 1)
+    if levels < 1 or nx % scale or ny % scale:
+        raise Exception("Grid %s can not be reduced to %d levels" % ((nx, ny), levels))
+    
+    keys, sums = grid.cellSums()
+    pyramid = [((nx, ny), keys, sums)]
+    for _ in range(levels - 1):
+        cy, cx = np.divmod(keys, nx)
+        nx, ny = nx // 2, ny // 2
+        keys, sums = _groupSums((cy // 2) * nx + cx // 2, sums.T)
+        pyramid.append(((nx, ny), keys, sums))
+    return pyramid
+
+def savePyramid(fname, grid, levels):
+    """Saves un-normalized pyramid levels into single .npz file"""
+    members = { 'version' : ArrayHeatGrid.STATE_VERSION, 'area' : tuple(grid.area), 'levels' : levels }
+    for level, (dims, keys, sums) in enumerate(buildPyramid(grid, levels)):
+        members['dims%d' % level] = dims
+        members['keys%d' % level] = keys
+        members['sums%d' % level] = sums
+    
+    with open(fname, 'wb') as f:
+        np.savez_compressed(f, **members)
+
+def loadPyramidLevel(fname, level, sparse=None):
+    """Creates grid from the level of pyramid saved by savePyramid, 0 is the finest level"""
+    with np.load(fname) as data:
+        if int(data['version']) != ArrayHeatGrid.STATE_VERSION:
+            raise Exception("Unsupported pyramid version %s in %s" % (data['version'], fname))
+        if level < 0 or level >= int(data['levels']):
+            raise Exception("Pyramid %s has no level %d" % (fname, level))
+        
+        area = tuple(data['area'].tolist())
+        dims = tuple(data['dims%d' % level].tolist())
+        grid = _createGrid(area, dims, None, sparse)
+        grid.addCellSums(data['keys%d' % level], data['sums%d' % level])
+    return grid
+
+def adaptivePoints(grid, max_points, min_items=1):
+    """
+    Collapses occupied cells of the grid into at most max_points weighted
+    centroids of quad tree leaves. The leaf with the biggest weight is split
+    into quadrants first as long as the number of non-empty leaves stays
+    within max_points, leaves of min_items cells or less are kept whole.
+    Returns (n, 3) array normalized like normalizedPoints
+    """
+    if max_points < 1:
+        raise Exception("Number of output points should be positive")
+    
+    keys, sums = grid.cellSums()
+    if not len(keys):
+        return np.zeros((0, 3))
+    xs, ys = sums[:,0] / sums[:,2], sums[:,1] / sums[:,2]
+    
+    # leaves are (-weight, seq, rect, index array of cells), the heaviest
+    # leaf is on top of the heap, leaves which are not split are final
+    heap = [(-sums[:,2].sum(), 0, tuple(grid.area), np.arange(len(keys)))]
+    final = []
+    seq = leaves = 1
+    while heap:
+        leaf = heapq.heappop(heap)
+        x0, y0, x1, y1 = leaf[2]
+        idx = leaf[3]
+        x, y = xs[idx], ys[idx]
+        if len(idx) <= max(min_items, 1) or ((x == x[0]).all() and (y == y[0]).all()):
+            final.append(idx)
+            continue
+        
+        # points on the middle lines go to the lower quadrant like on QuadTree split
+        mx, my = (x0 + x1) * 0.5, (y0 + y1) * 0.5
+        q = 2 * (x > mx) + (y > my)
+        occupied = np.unique(q)
+        if leaves + len(occupied) - 1 > max_points:
+            final.append(idx)
+            continue
+        
+        leaves += len(occupied) - 1
+        quadrants = ((x0, y0, mx, my), (x0, my, mx, y1), (mx, y0, x1, my), (mx, my, x1, y1))
+        for c in occupied.tolist():
+            child = idx[q == c]
+            heapq.heappush(heap, (-sums[child, 2].sum(), seq, quadrants[c], child))
+            seq += 1
+    
+    labels = np.empty(len(keys), np.int64)
+    for n, idx in enumerate(final):
+        labels[idx] = n
+    
+    _, sums = _groupSums(labels, sums.T)
+    W = sums[:,2]
+    return np.column_stack((sums[:,0] / W, sums[:,1] / W, W / W.max()))
+
+def streamSnapshots(grid, batches, every=None, requested=lambda: False):
+    """
+    Feeds stream of (n, 4) x,y,w,t point arrays into TimedHeatGrid and
+    yields (time, points) snapshots with normalized weights: every given
+    interval of stream time (intervals without points are skipped), after
+    batches for which requested() returns True and at the end of stream
+    """
+    due = None
+    for batch in batches:
+        ts = grid._timestamps(batch[:,3], len(batch))
+        if every and due is None and len(ts):
+            due = (math.floor(ts.min() / every) + 1) * every
+        
+        while every and len(ts) and ts.max() >= due:
+            early = ts < due
+            grid.insert_many(batch[early,0], batch[early,1], batch[early,2], ts[early])
+            batch, ts = batch[~early], ts[~early]
+            yield due, grid.normalizedPoints(due)
+            due = (math.floor(ts.min() / every) + 1) * every
+        
+        grid.insert_many(batch[:,0], batch[:,1], batch[:,2], ts)
+        if requested():
+            yield grid.now, grid.normalizedPoints()
+    
+    if grid.now is not None:
+        yield grid.now, grid.normalizedPoints()
+
+def _groupSums(keys, columns):
+    # unique keys and (n, k) sums of columns values per key
+    keys, inv = np.unique(keys, return_inverse=True)
+    sums = np.empty((len(keys), len(columns)))
+    for c, v in enumerate(columns):
+        sums[:,c] = np.bincount(inv, weights=v, minlength=len(keys))
+    return keys, sums
+
+def _accumulateShard(job):
+    # returns cell sums of the shard and stats report when collect is set
+    shard, area, cells_num, cell_size, sparse, collect = job
+    collected = stats.enable() if collect else None
+    try:
+        keys, sums = accumulate(pointio.read_shard(shard), area, cells_num, cell_size, sparse).cellSums()
+    finally:
+        if collect:
+            stats.disable()
+    return keys, sums, collected.report() if collect else {}
+
+def _createGrid(area, cells_num, cell_size, sparse):
+    if sparse is None:
+        if cells_num:
+            nx, ny = cells_num
+        else:
+            nx = round((area[2] - area[0]) / cell_size)
+            ny = round((area[3] - area[1]) / cell_size)
+        sparse = nx * ny > SPARSE_CELLS
+    
+    return ArrayHeatGrid(area, lambda x: (x[0],x[1]), cell_size=cell_size, cells_num=cells_num, sparse=sparse)
+
+#====================================================
+
 if __name__ == '__main__':
-    def read_stream(s):
-        while True:
-            l = s.readline().strip()
-            if not l:
-                break
-            
-            vals = map(float, l.split(','))
-            if len(vals) == 2:
-                vals.append(1.0)
-            if len(vals) != 3:
-                raise Exception("Invalid data length: %s" % (l))
-            yield tuple(vals)
+    import argparse, signal, io
     
-    def read_csv(filenames):
-        for fname in filenames:
-            with open(fname, 'r') as f:
-                for v in read_stream(f):
-                    yield v
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        parser = argparse.ArgumentParser(prog='heataccum.py merge', description='Merges accumulator states and outputs the result')
+        parser.add_argument('--save-state', dest="save_state", help="save merged un-normalized state into file")
+        parser.add_argument('--format', dest="format", help="output format", choices=pointio.FORMATS, default='csv')
+        parser.add_argument('state', nargs='+', help="state file saved with --save-state")
+        
+        args = parser.parse_args(sys.argv[2:])
+        grid = mergeStates(args.state)
+        
+        if args.save_state:
+            grid.saveState(args.save_state)
+        with pointio.openWriter(sys.stdout, args.format) as out:
+            out.write(grid.normalizedPoints())
+        sys.exit(0)
     
+    if len(sys.argv) > 1 and sys.argv[1] == 'extract':
+        parser = argparse.ArgumentParser(prog='heataccum.py extract', description='Outputs accumulated points of pyramid level')
+        parser.add_argument('--level', dest="level", help="pyramid level, 0 is the finest one", type=int, default=0)
+        parser.add_argument('--format', dest="format", help="output format", choices=pointio.FORMATS, default='csv')
+        parser.add_argument('pyramid', help="pyramid file saved with --pyramid")
+        
+        args = parser.parse_args(sys.argv[2:])
+        grid = loadPyramidLevel(args.pyramid, args.level)
+        
+        with pointio.openWriter(sys.stdout, args.format) as out:
+            out.write(grid.normalizedPoints())
+        sys.exit(0)
     
-    import argparse
     parser = argparse.ArgumentParser(description='Accumulates events heat with specified precision and outputs the result')
     parser.add_argument('--area', dest="area", help="bounding rect of event coordinates (x0,y0,x1,y1)", default='0,0,1,1')
     parser.add_argument('--grid', dest="grid", help="Number of x,y grid cells for subdivision", default='100,100')
     parser.add_argument('--error', dest="error", help="maximum error allowed", type=float, default=None)
-    parser.add_argument('file', nargs='*', help="the source CSV file")
+    parser.add_argument('--sparse', dest="sparse", help="allocate only occupied cells (default for grids over %d cells)" % (SPARSE_CELLS), action='store_true')
+    parser.add_argument('--workers', dest="workers", help="number of processes accumulating shards of input files", type=int, default=1)
+    parser.add_argument('--load-state', dest="load_state", help="continue accumulation from the state saved with --save-state")
+    parser.add_argument('--save-state', dest="save_state", help="save un-normalized accumulator state into file")
+    parser.add_argument('--pyramid', dest="pyramid", help="save accumulation pyramid into file, grid is the finest level")
+    parser.add_argument('--levels', dest="levels", help="number of pyramid levels", type=int, default=4)
+    parser.add_argument('--max-points', dest="max_points", help="output at most given number of points collapsing grid cells adaptively with quad tree", type=int, default=None)
+    parser.add_argument('--min-items', dest="min_items", help="number of grid cells under which quad tree leaves are not split", type=int, default=1)
+    parser.add_argument('--decay', dest="decay", help="half life of point weights, enables time decay mode (timestamps are in 4th column)", type=float, default=None)
+    parser.add_argument('--window', dest="window", help="length of sliding time window, enables window mode (timestamps are in 4th column)", type=float, default=None)
+    parser.add_argument('--buckets', dest="buckets", help="number of time buckets of sliding window", type=int, default=60)
+    parser.add_argument('--snapshot-every', dest="snapshot_every", help="output snapshot every given interval of stream time, snapshots are also written on SIGUSR1 (requires --snapshot-out)", type=float, default=None)
+    parser.add_argument('--snapshot-out', dest="snapshot_out", help="snapshot file name pattern with %%d for snapshot number, by default only the final snapshot goes to stdout")
+    parser.add_argument('--format', dest="format", help="output format, binary input is detected automatically", choices=pointio.FORMATS, default='csv')
+    parser.add_argument('--stats', dest="stats", help="write stage timings and counters as JSON into file, - for stderr", default=None)
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
     
     args = parser.parse_args()
     area = tuple(map(float, args.area.split(',')))
     dims = tuple(map(int, args.grid.split(','))) if not args.error else None
     error = args.error
-    points = read_csv(args.file) if args.file else read_stream(sys.stdin)
+    
+    sparse = args.sparse or None
+    if args.stats:
+        stats.enable()
     
     try:
-        grid = HeatGrid(area, lambda x: (x[0],x[1]), cell_size=error, cells_num=dims)
+        if args.decay or args.window:
+            if args.decay and args.window:
+                raise Exception('Decay and window modes are mutually exclusive')
+            if args.sparse or args.workers > 1 or args.load_state or args.save_state:
+                raise Exception('Time modes support neither sparse grids, workers nor states')
+            
+            if args.decay:
+                grid = DecayHeatGrid(area, cell_size=error, cells_num=dims, half_life=args.decay)
+            else:
+                grid = WindowHeatGrid(area, cell_size=error, cells_num=dims, window=args.window, buckets=args.buckets)
+            
+            # live stdin is read unbuffered to get points as soon as they arrive,
+            # SIGUSR1 requests snapshot after the next block of input
+            stream = None if args.file else io.open(sys.stdin.fileno(), 'rb', buffering=0)
+            points = stats.iterate('read', pointio.read_points(args.file, stream, ncols=4))
+            
+            # without --snapshot-out requests are only reported, but the handler
+            # is still needed as the default action of SIGUSR1 is to terminate
+            requested = []
+            signal.signal(signal.SIGUSR1, lambda signum, frame: requested.append(signum))
+            signal.siginterrupt(signal.SIGUSR1, False)
+            def popRequest():
+                pending = bool(requested)
+                del requested[:]
+                if pending and not args.snapshot_out:
+                    sys.stderr.write("Snapshot requests require --snapshot-out, request ignored\n")
+                    return False
+                return pending
+            
+            if not args.snapshot_out:
+                # point readers stop at the first empty line, so stdout gets single snapshot
+                if args.snapshot_every:
+                    raise Exception('Repeated snapshots require --snapshot-out')
+                with pointio.openWriter(sys.stdout, args.format) as out:
+                    for _, snapshot in streamSnapshots(grid, points, requested=popRequest):
+                        stats.count('snapshots')
+                        out.write(snapshot)
+                sys.exit(0)
+            
+            for n, (at, snapshot) in enumerate(streamSnapshots(grid, points, args.snapshot_every, popRequest)):
+                stats.count('snapshots')
+                with open(args.snapshot_out % n, 'wb') as f:
+                    with pointio.openWriter(f, args.format) as out:
+                        out.write(snapshot)
+            sys.exit(0)
         
-        for p in points:
-            grid.insert(p)
+        with stats.stage('accumulate'):
+            if args.file:
+                grid = accumulateFiles(args.file, area, cells_num=dims, cell_size=error, sparse=sparse, workers=args.workers)
+            else:
+                grid = accumulate(pointio.read_points(None), area, cells_num=dims, cell_size=error, sparse=sparse)
         
-        max_heat = max([i[2] for i in grid.items])
+        if args.load_state:
+            grid.mergeState(args.load_state)
+        if args.save_state:
+            grid.saveState(args.save_state)
+        if args.pyramid:
+            savePyramid(args.pyramid, grid, args.levels)
         
-        for p in grid.items:
-            x,y,w = p
-            print '%s,%s,%s' % (x,y,w/max_heat)
+        if stats.enabled():
+            stats.count('cells', len(grid.cellSums()[0]))
+        
+        with stats.stage('write'):
+            with pointio.openWriter(sys.stdout, args.format) as out:
+                if args.max_points:
+                    out.write(adaptivePoints(grid, args.max_points, args.min_items))
+                else:
+                    out.write(grid.normalizedPoints())
         
     except KeyboardInterrupt:
         pass
-
-
-
-
+    finally:
+        if args.stats:
+            stats.save(args.stats)
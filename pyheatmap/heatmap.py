@@ -1,10 +1,20 @@
 from PIL import Image, ImageChops
+import numpy as np
 import math
 
+import kernels
+import pointio
+import splat
+import stats
+
 class Heatmap:
     """Create heatmaps from a list of 2D coordinates"""
 
-    def create(self, points, palette, size=None, dotsize=150, opacity=0.9, background=None):
+    ENGINES = ('pil', 'numpy', 'hist')
+    SCALES = ('linear', 'log', 'sqrt')
+
+    def create(self, points, palette, size=None, dotsize=150, opacity=0.9, background=None, engine='pil', scale=None,
+               kernel='linear', falloff=1.0):
         """
         points  -> an iterable list of tuples, where the contents are the 
                    x,y coordinates to plot. e.g., [(1, 1), (2, 2), (3, 3)]
@@ -19,23 +29,52 @@ class Heatmap:
                    Tweak this parameter to adjust the resulting heatmap.
         background -> background image or color tuple
         dotweight -> defines the alpha weight of single dot
+        engine  -> mask building engine: 'pil' splats points one by one,
+                   'numpy' accumulates all points in batches, both produce
+                   the same mask. 'hist' bins points into per-pixel histogram
+                   and convolves it with the dot once, its cost does not
+                   depend on number of points
+        scale   -> enables high dynamic range accumulation: dots are summed
+                   without clipping and the result is mapped to [0, 255]
+                   using 'linear', 'log' or 'sqrt' scale, weights may be
+                   any positive values in this mode. Not supported by 'pil'
+                   engine
+        kernel  -> dot shape: 'linear', 'gaussian', 'quartic' or 'epanechnikov'
+        falloff -> relative radius at which dot strength reaches zero
         """
         if not size and (not background or not isinstance(background, Image.Image)):
             raise Exception("Either size or background image should be specified")
+        if engine not in self.ENGINES:
+            raise Exception("Unknown engine '%s'" % (engine))
+        if scale is not None and scale not in self.SCALES:
+            raise Exception("Unknown scale '%s'" % (scale))
+        if scale is not None and engine == 'pil':
+            raise Exception("High dynamic range scale is not supported by '%s' engine" % (engine))
 
         self.points = points
         self.dotsize = dotsize
         self.opacity = opacity
+        self.scale = scale
         self.size =  background.size if background else size
-        self.palette = self._loadPalette(palette)
+        with stats.stage('palette'):
+            self.palette = self._loadPalette(palette)
         self.background = background or (255,255,255)
 
-        dot = self._buildDot(self.dotsize)
-        mask = self._buildMask(dot)
+        with stats.stage('dot'):
+            dot = self._buildDot(self.dotsize, kernel, falloff)
+        with stats.stage('mask'):
+            if engine == 'pil':
+                mask = self._buildMask(dot)
+            elif engine == 'numpy':
+                mask = self._buildMaskArray(dot)
+            else:
+                mask = self._buildMaskDensity(dot)
 
-        res = self._colorize(mask)
-        bg = self._getBackgroundImg()
-        return res if not bg else Image.composite(res, bg, res)
+        with stats.stage('colorize'):
+            res = self._colorize(mask)
+        with stats.stage('composite'):
+            bg = self._getBackgroundImg()
+            return res if not bg else Image.composite(res, bg, res)
 
     def _loadPalette(self, palette):
         """
@@ -53,27 +92,13 @@ class Heatmap:
 
         return stops
 
-    def _buildDot(self, size):
+    def _buildDot(self, size, shape='linear', falloff=1.0):
         """ 
         Builds a dot mask that is used for plotting
             each point in the dataset
         """
     
-        img = Image.new("L", (size, size))
-        pix = img.load()
-        
-        center = (size / 2.0)
-        r_rec = 1.0 / math.sqrt( center * center )
-        
-        for x in range(size):
-            for y in range(size):
-                dx = x - center
-                dy = y - center
-                d = math.sqrt( dx * dx + dy * dy )
-                c = 255 - int( 255 * d * r_rec )
-                pix[x,y] = c
-            
-        return img
+        return Image.fromarray(kernels.getKernel(shape, size, falloff), 'L')
 
     def _buildMask(self, dot):
         """
@@ -83,7 +108,7 @@ class Heatmap:
         mask = Image.new('L', self.size)
         ds_2 = dot.size[0] / 2;
         
-        for pnt in self.points:
+        for pnt in pointio.rows(self.points):
             x = int(pnt[0] * self.size[0])
             y = int((1.0 -pnt[1]) * self.size[1])
             w = pnt[2] if len(pnt) > 2 else 1.0
@@ -98,30 +123,75 @@ class Heatmap:
 
         return mask
 
+    def _buildMaskArray(self, dot):
+        """
+        Creates the 'splatted' image accumulating all points at once,
+        in HDR mode the raw float32 accumulation buffer is returned
+        """
+
+        if self.scale:
+            acc = np.zeros((self.size[1], self.size[0]), np.float32)
+            return splat.splatPoints(acc, self.points, np.asarray(dot), quantize=False)
+
+        acc = np.zeros((self.size[1], self.size[0]), np.uint32)
+        splat.splatPoints(acc, self.points, np.asarray(dot))
+        return Image.fromarray(np.minimum(acc, 255).astype(np.uint8), 'L')
+
+    def _buildMaskDensity(self, dot):
+        """
+        Creates the 'splatted' image convolving histogram of points with the dot
+        """
+
+        acc = splat.densityPoints(self.size, self.points, np.asarray(dot), quantize=not self.scale)
+        if self.scale:
+            return np.maximum(acc, 0).astype(np.float32)
+
+        return Image.fromarray(np.clip(np.rint(acc), 0, 255).astype(np.uint8), 'L')
+
     def _colorize(self, mask):
         """ 
     Use the colorscheme selected to color the 
         image densities
     """
 
-        mask = mask.load()
+        if self.scale:
+            mask = self._normalizeMask(mask)
 
-        img = Image.new("RGBA", self.size)
-        pix = img.load()
-        
-        w,h = img.size
-        for x in range(w):
-            for y in range(h):
-                strength = mask[x, y]
-                r, g, b, a = self.palette[strength]
+        lut = self._buildLookupTable()
+        return Image.fromarray(lut[np.asarray(mask)], 'RGBA')
+
+    def _normalizeMask(self, acc):
+        """
+        Maps HDR accumulation buffer to 8-bit mask strength
+        """
+
+        top = float(acc.max())
+        if top <= 0:
+            return np.zeros(acc.shape, np.uint8)
 
-                # measure for palettes with no alpha
-                a = int(a * self.opacity) if strength > 0 else 0
-                
-                rgba = (r, g, b, a)
-                pix[x,y] = rgba
+        if self.scale == 'log':
+            norm = np.log1p(acc) / math.log1p(top)
+        elif self.scale == 'sqrt':
+            norm = np.sqrt(acc / top)
+        else:
+            norm = acc / top
 
-        return img
+        return (norm * 255 + 0.5).astype(np.uint8)
+
+    def _buildLookupTable(self):
+        """
+        Compiles palette and opacity into (256, 4) table of RGBA colors
+        indexed by mask strength
+        """
+
+        lut = np.array(self.palette, np.uint8).reshape(256, 4)
+        
+        # measure for palettes with no alpha
+        alpha = [int(a * self.opacity) for a in lut[:, 3].tolist()]
+        lut[:, 3] = np.clip(alpha, 0, 255)
+        lut[0, 3] = 0
+        
+        return lut
 
     def _getBackgroundImg(self):
         """
@@ -135,24 +205,119 @@ class Heatmap:
         return None
 
 
+class LiveHeatmap(Heatmap):
+    """Heatmap that keeps accumulated mask between updates and re-renders
+    only regions touched by dots of added or removed points"""
+
+    # size of square blocks used to track changed regions of the image
+    BLOCK = 32
+
+    def __init__(self, palette, size=None, dotsize=150, opacity=0.9, background=None, kernel='linear', falloff=1.0,
+                 dtype=np.int32):
+        """
+        Parameters are the same as of Heatmap.create, the image is the same
+        as Heatmap.create with 'numpy' engine renders for the current points.
+        dtype   -> type of the accumulated mask, integer masks are exact,
+                   float ones keep fractional heat and can be faded
+        """
+        if not size and not isinstance(background, Image.Image):
+            raise Exception("Either size or background image should be specified")
+
+        self.dotsize = dotsize
+        self.opacity = opacity
+        self.scale = None
+        self.size = background.size if isinstance(background, Image.Image) else size
+        self.palette = self._loadPalette(palette)
+        self.background = background or (255,255,255)
+
+        self.dot = np.asarray(self._buildDot(dotsize, kernel, falloff))
+        self.lut = self._buildLookupTable()
+        self.acc = np.zeros((self.size[1], self.size[0]), dtype)
+        self._quantize = np.issubdtype(self.acc.dtype, np.integer)
+
+        self._bg = self._getBackgroundImg()
+        self._image = self._bg.copy()
+
+        b = self.BLOCK
+        self._dirty = np.zeros(((self.size[1] + b - 1) // b, (self.size[0] + b - 1) // b), bool)
+
+    def add_points(self, points):
+        """Splats iterable of (x,y[,w]) tuples or point arrays"""
+        self._update(points, False)
+
+    def remove_points(self, points):
+        """Removes dots of points added before"""
+        self._update(points, True)
+
+    def fade(self, factor):
+        """Multiplies accumulated heat of float mask by factor"""
+        if self._quantize:
+            raise Exception("Integer mask can not be faded")
+        self.acc *= factor
+        self._dirty[:] = True
+
+    @property
+    def dirtyRects(self):
+        """List of (x0, y0, x1, y1) image regions changed since the last render"""
+        b = self.BLOCK
+        w, h = self.size
+        rects = []
+        for by, row in enumerate(self._dirty.tolist()):
+            bx = 0
+            while bx < len(row):
+                if not row[bx]:
+                    bx += 1
+                    continue
+                start = bx
+                while bx < len(row) and row[bx]:
+                    bx += 1
+                rects.append((start * b, by * b, min(bx * b, w), min((by + 1) * b, h)))
+        return rects
+
+    def render(self):
+        """Re-colorizes and composites changed regions, returns the image"""
+        for box in self.dirtyRects:
+            x0, y0, x1, y1 = box
+            mask = np.clip(self.acc[y0:y1, x0:x1], 0, 255).astype(np.uint8)
+            res = Image.fromarray(self.lut[mask], 'RGBA')
+
+            # same as Image.composite of the whole image does
+            self._image.paste(self._bg.crop(box), box)
+            self._image.paste(res, box, res)
+
+        self._dirty[:] = False
+        return self._image
+
+    def _update(self, points, subtract):
+        h, w = self.acc.shape
+        for batch in pointio.batches(points):
+            px, py = splat.toPixels(batch, (w, h))
+            splat.splat(self.acc, px, py, batch[:, 2], self.dot, self._quantize, subtract)
+            self._markDirty(px, py)
+
+    def _markDirty(self, px, py):
+        h, w = self.acc.shape
+        kh, kw = self.dot.shape
+        b = self.BLOCK
+
+        x0 = px - kw // 2
+        y0 = py - kw // 2
+        visible = (x0 > -kw) & (x0 < w) & (y0 > -kh) & (y0 < h)
+        x0, y0 = x0[visible], y0[visible]
+        if not len(x0):
+            return
+
+        bx0, bx1 = np.maximum(x0, 0) // b, np.minimum(x0 + kw - 1, w - 1) // b
+        by0, by1 = np.maximum(y0, 0) // b, np.minimum(y0 + kh - 1, h - 1) // b
+        for dy in range(int((by1 - by0).max()) + 1):
+            for dx in range(int((bx1 - bx0).max()) + 1):
+                sel = (by0 + dy <= by1) & (bx0 + dx <= bx1)
+                self._dirty[by0[sel] + dy, bx0[sel] + dx] = True
+
+
 if __name__ == '__main__':
     import sys, argparse
     
-    def read_stream(s):
-        while True:
-            l = s.readline().strip()
-            if not l:
-                break
-            
-            vals = map(float, l.split(','))
-            yield tuple(vals)
-    
-    def read_csv(filenames):
-        for fname in filenames:
-            with open(fname, 'r') as f:
-                for v in read_stream(f):
-                    yield v
-    
     parser = argparse.ArgumentParser(description='Draws heatmaps from CSV files or stdin')
     parser.add_argument('--palette', dest="palette", help="palette file for color mapping", default='resources/palette.png')
     parser.add_argument('--bg', dest="background", help="background file name")
@@ -160,23 +325,37 @@ if __name__ == '__main__':
     parser.add_argument('--dotsize', dest="dotsize", help="size of the heat dot", default=100, type=int)
     parser.add_argument('--opacity', dest="opacity", help="opacity of the heat layer", default=0.9, type=float)
     parser.add_argument('--out', dest="output", help="specifies output file name", default="heatmap.jpg")
-    parser.add_argument('file', nargs='*', help="the source CSV file")
+    parser.add_argument('--engine', dest="engine", help="mask building engine", choices=Heatmap.ENGINES, default=None)
+    parser.add_argument('--kernel', dest="kernel", help="shape of the heat dot", choices=kernels.SHAPES, default='linear')
+    parser.add_argument('--falloff', dest="falloff", help="relative radius at which dot strength reaches zero", default=1.0, type=float)
+    parser.add_argument('--scale', dest="scale", help="accumulate without clipping and normalize heat using given scale", choices=Heatmap.SCALES, default=None)
+    parser.add_argument('--input-format', dest="input_format", help="input format", choices=('auto', 'csv', 'bin'), default='auto')
+    parser.add_argument('--stats', dest="stats", help="write stage timings and counters as JSON into file, - for stderr", default=None)
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
 
     args = parser.parse_args()
     size = tuple(map(int, args.size.split(',')))
+    engine = args.engine or ('numpy' if args.scale else 'pil')
     
     if args.background:
         args.background = Image.open(args.background)
     
-    points = read_csv(args.file) if args.file else read_stream(sys.stdin)
+    if args.stats:
+        stats.enable()
+    points = stats.iterate('read', pointio.read_points(args.file, format=args.input_format))
     
     try:
         img = Heatmap().create(points=points, palette=args.palette, size=size,\
                                dotsize=args.dotsize or None, opacity=args.opacity,\
-                               background=args.background)
+                               background=args.background, engine=engine, scale=args.scale,\
+                               kernel=args.kernel, falloff=args.falloff)
         
-        img.save(args.output, 'JPEG')
+        with stats.stage('encode'):
+            img.save(args.output, 'JPEG')
     except KeyboardInterrupt:
         pass
+    finally:
+        if args.stats:
+            stats.save(args.stats)
 
 
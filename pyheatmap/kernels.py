@@ -0,0 +1,101 @@
+import numpy as np
+import math
+from collections import OrderedDict
+
+#====================================================
+
+def _linear(u):
+    return u
+
+def _gaussian(u):
+    # support radius covers 3 sigmas, the tail is shifted to reach zero there
+    tail = math.exp(-4.5)
+    return 1.0 - (np.exp(-4.5 * u * u) - tail) / (1.0 - tail)
+
+def _quartic(u):
+    v = 1.0 - u * u
+    return 1.0 - v * v
+
+def _epanechnikov(u):
+    return u * u
+
+# falloff profiles: fraction of strength lost at relative distance u from
+# the center, 0.0 at the center and 1.0 at the edge of the kernel
+PROFILES = {
+    'linear' : _linear,
+    'gaussian' : _gaussian,
+    'quartic' : _quartic,
+    'epanechnikov' : _epanechnikov,
+}
+
+SHAPES = tuple(sorted(PROFILES))
+
+def buildKernel(shape, size, falloff=1.0):
+    """
+    Builds (size, size) uint8 array with the dot kernel of given shape.
+    falloff scales the kernel radius, i.e. with 0.5 strength reaches zero
+    at the half of the dot radius
+    """
+    if shape not in PROFILES:
+        raise Exception("Unknown kernel shape '%s'" % (shape))
+    if size <= 0 or falloff <= 0:
+        raise Exception("Invalid kernel size %s or falloff %s" % (size, falloff))
+
+    center = (size / 2.0)
+    r_rec = 1.0 / math.sqrt( center * center )
+
+    d = np.arange(size) - center
+    d = np.sqrt( d[:, None] * d[:, None] + d[None, :] * d[None, :] )
+
+    if shape == 'linear':
+        # same arithmetic as the original per-pixel loop in Heatmap._buildDot
+        lost = 255 * d * r_rec / falloff
+    else:
+        lost = 255 * PROFILES[shape](np.minimum(d * r_rec / falloff, 1.0))
+
+    kernel = np.clip(255 - lost.astype(np.int64), 0, 255).astype(np.uint8)
+    kernel.flags.writeable = False
+    return kernel
+
+#====================================================
+
+class KernelCache(object):
+    def __init__(self, max_bytes=64 << 20):
+        """LRU cache of kernels bounded by total size of kernel arrays"""
+
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._kernels = OrderedDict()
+
+    def __len__(self):
+        return len(self._kernels)
+
+    def __contains__(self, key):
+        return key in self._kernels
+
+    def get(self, shape, size, falloff=1.0):
+        key = (shape, int(size), float(falloff))
+        kernel = self._kernels.pop(key, None)
+        if kernel is None:
+            kernel = buildKernel(*key)
+            self.nbytes += kernel.nbytes
+
+        self._kernels[key] = kernel
+
+        while self.nbytes > self.max_bytes and len(self._kernels) > 1:
+            _, old = self._kernels.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+        return kernel
+
+    def clear(self):
+        self._kernels.clear()
+        self.nbytes = 0
+
+#====================================================
+
+cache = KernelCache()
+
+def getKernel(shape, size, falloff=1.0):
+    """Returns read only kernel array from the shared cache"""
+    return cache.get(shape, size, falloff)
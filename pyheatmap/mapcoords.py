@@ -1,56 +1,174 @@
 from partition.qtree import Rect
+import numpy as np
+import itertools
 import sys
 
+import pointio
+import projections
+import stats
+
+# number of histogram bins used to find percentile bounds
+CLIP_BINS = 1 << 16
+
+# number of points normalize_coords converts at once
+NORMALIZE_CHUNK = 4096
+
 #====================================================
 
-def normalize_coords(points, area):
+def normalize_coords(points, area, projection=None):
+    """
+    Normalizes x,y of point lists in place and yields them as tuples,
+    points are normalized in chunks of NORMALIZE_CHUNK and the number of
+    points falling outside of area is reported at the end
+    """
+    area = tuple(Rect(area))
+    normalize = projection.normalizer(area) if projection is not None else lambda batch: normalize_batch(batch, area)
+    
+    points = iter(points)
+    outside = total = 0
+    while True:
+        chunk = list(itertools.islice(points, NORMALIZE_CHUNK))
+        if not chunk:
+            break
+        
+        coords = np.array([p[:2] for p in chunk], np.float64)
+        outside += count_outside(coords, area)
+        total += len(chunk)
+        for p, (x, y) in zip(chunk, normalize(coords).tolist()):
+            p[0], p[1] = x, y
+            yield tuple(p)
+    
+    if outside:
+        sys.stderr.write("%d of %d points fall outside of given area\n" % (outside, total))
+
+def normalize_batch(batch, area):
+    """Normalizes x,y columns of (n, k) array in place, returns the array"""
     area = Rect(area)
     winv = 1.0 / area.width
     hinv = 1.0 / area.height
     
-    for p in points:
-        if not area.contains(p):
-            sys.stderr.write("Point %s falls outside of given area\n" % (tuple(p),))
-        p[0] = (p[0] - area[0]) * winv
-        p[1] = (p[1] - area[1]) * hinv
-        yield tuple(p)
+    batch[:,0] = (batch[:,0] - area[0]) * winv
+    batch[:,1] = (batch[:,1] - area[1]) * hinv
+    return batch
+
+def count_outside(batch, area):
+    """Returns number of points of (n, k) array falling outside of area"""
+    x, y = batch[:,0], batch[:,1]
+    inside = (x >= area[0]) & (x <= area[2]) & (y >= area[1]) & (y <= area[3])
+    return len(batch) - int(np.count_nonzero(inside))
+
+def find_area(batches):
+    """Returns bounding rect (x0,y0,x1,y1) of points in one pass over (n, k) arrays"""
+    lo = np.array([np.inf, np.inf])
+    hi = -lo
+    for batch in batches:
+        if len(batch):
+            lo = np.minimum(lo, batch[:,:2].min(0))
+            hi = np.maximum(hi, batch[:,:2].max(0))
+    
+    if not (lo <= hi).all():
+        raise Exception("No points to find area of")
+    return _extent(lo, hi)
+
+def clip_area(batches, area, percent):
+    """
+    Narrows area found by find_area to the range between percent and
+    100 - percent percentiles of x and y, percentiles are taken from
+    histograms of CLIP_BINS bins and rounded outwards to bin edges
+    """
+    if not 0.0 <= percent < 50.0:
+        raise Exception("Clip percentile should be within [0, 50)")
+    
+    lo, hi = np.array(area[:2], np.float64), np.array(area[2:], np.float64)
+    hist = np.zeros((2, CLIP_BINS), np.int64)
+    for batch in batches:
+        for c in range(2):
+            bins = ((batch[:,c] - lo[c]) / (hi[c] - lo[c]) * CLIP_BINS).astype(np.int64)
+            hist[c] += np.bincount(np.clip(bins, 0, CLIP_BINS - 1), minlength=CLIP_BINS)
+    
+    cum = np.cumsum(hist, 1)
+    bounds = []
+    for c in range(2):
+        total = cum[c,-1]
+        first = np.searchsorted(cum[c], total * percent / 100.0, 'right')
+        last = np.searchsorted(cum[c], total * (100.0 - percent) / 100.0, 'left')
+        step = (hi[c] - lo[c]) / CLIP_BINS
+        bounds.append((lo[c] + first * step, min(hi[c], lo[c] + (last + 1) * step)))
+    
+    (x0, x1), (y0, y1) = bounds
+    return _extent(np.array([x0, y0]), np.array([x1, y1]))
+
+def _spooled(batches, out):
+    # yields batches writing them with the point writer on the way
+    for batch in batches:
+        out.write(batch)
+        yield batch
+
+def _extent(lo, hi):
+    # single point or line still gets non-empty area
+    hi = np.where(hi > lo, hi, lo + 1.0)
+    return (float(lo[0]), float(lo[1]), float(hi[0]), float(hi[1]))
 
 #====================================================
 
 if __name__ == '__main__':
-    def read_stream(s):
-        while True:
-            l = s.readline().strip()
-            if not l:
-                break
-            
-            vals = map(float, l.split(','))
-            if len(vals) < 2 or len(vals) > 3:
-                raise Exception("Invalid data length: %s" % (l))
-            yield vals
-    
-    def read_csv(filenames):
-        for fname in filenames:
-            with open(fname, 'r') as f:
-                for v in read_stream(f):
-                    yield v
-    
-    
-    import argparse
+    import argparse, tempfile
     parser = argparse.ArgumentParser(description='Normalizes input coords according to specified bounding rect')
-    parser.add_argument('--area', dest="area", help="bounding rect of event coordinates (x0,y0,x1,y1)", default='0,0,1,1')
-    parser.add_argument('file', nargs='*', help="the source CSV file")
+    parser.add_argument('--area', dest="area", help="bounding rect of event coordinates (x0,y0,x1,y1) or 'auto' to find it from the input", default='0,0,1,1')
+    parser.add_argument('--clip', dest="clip", help="percentile of outlying points excluded from each side of auto area", type=float, default=None)
+    parser.add_argument('--projection', dest="projection", help="projection of input coordinates applied before normalization: mercator, equirect[:lat0] or affine:a,b,c,d,e,f (area is given in input coordinates)", default=None)
+    parser.add_argument('--format', dest="format", help="output format, binary input is detected automatically", choices=pointio.FORMATS, default='csv')
+    parser.add_argument('--stats', dest="stats", help="write stage timings and counters as JSON into file, - for stderr", default=None)
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
     
     args = parser.parse_args()
-    area = tuple(map(float, args.area.split(',')))
-    points = read_csv(args.file) if args.file else read_stream(sys.stdin)
+    if args.stats:
+        stats.enable()
     
+    spool = None
     try:
-        for p in normalize_coords(points, area):
-            print ','.join(map(str,p))
+        if args.area == 'auto':
+            # binary files are memory mapped on every pass, text input is parsed
+            # once into temporary binary file while finding the bounds
+            with stats.stage('bounds'):
+                if args.file and all(pointio.is_binary(f) for f in args.file):
+                    read = lambda: pointio.read_points(args.file)
+                    area = find_area(read())
+                else:
+                    spool = tempfile.NamedTemporaryFile(suffix='.bin')
+                    with pointio.openWriter(spool, 'bin64') as out:
+                        area = find_area(_spooled(pointio.read_points(args.file), out))
+                    read = lambda: pointio.read_points([spool.name])
+                if args.clip:
+                    area = clip_area(read(), area, args.clip)
+            sys.stderr.write("Area %s\n" % (','.join(map(repr, area))))
+            points = read()
+        else:
+            area = tuple(map(float, args.area.split(',')))
+            points = pointio.read_points(args.file)
+        
+        if args.projection:
+            normalize = projections.createProjection(args.projection).normalizer(area)
+        else:
+            normalize = lambda batch: normalize_batch(batch, area)
+        
+        outside = total = 0
+        with pointio.openWriter(sys.stdout, args.format) as out:
+            for batch in stats.iterate('read', points):
+                with stats.stage('normalize'):
+                    outside += count_outside(batch, area)
+                    total += len(batch)
+                    batch = normalize(batch)
+                with stats.stage('write'):
+                    out.write(batch)
+        
+        stats.count('outside', outside)
+        if outside:
+            sys.stderr.write("%d of %d points fall outside of given area\n" % (outside, total))
     except KeyboardInterrupt:
         pass
-
-
-
-
+    finally:
+        if spool:
+            spool.close()
+        if args.stats:
+            stats.save(args.stats)
@@ -0,0 +1,390 @@
+from rect import Rect
+from qtree import Quater, QuadNode, PrinterVisitor
+from array import array
+import numpy as np
+import heapq
+
+try:
+    from .. import stats
+except ValueError:
+    # partition is top level package when tools run as scripts
+    import stats
+
+#====================================================
+
+class ArrayQuadNode(object):
+    """Lightweight view of the ArrayQuadTree node used by visitors"""
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def type(self):
+        return QuadNode.LEAF if self.tree._child[self.index] < 0 else QuadNode.BRANCH
+
+    @property
+    def parent(self):
+        p = self.tree._parent[self.index]
+        return ArrayQuadNode(self.tree, p) if p >= 0 else self.tree
+
+    @property
+    def area(self):
+        return self.tree._area(self.index)
+
+    @property
+    def quater(self):
+        p = self.tree._parent[self.index]
+        return self.index - self.tree._child[p] if p >= 0 else Quater.ROOT
+
+    @property
+    def children(self):
+        c = self.tree._child[self.index]
+        return [ArrayQuadNode(self.tree, c + q) for q in range(4)] if c >= 0 else []
+
+    @property
+    def items(self):
+        if self.tree._child[self.index] < 0:
+            return self.tree._items[self.index]
+        return self.tree._subtreeItems(self.index)
+
+    @property
+    def count(self):
+        return self.tree._count[self.index]
+
+    def accept(self, visitor):
+        if self.type == QuadNode.LEAF:
+            visitor.visitLeaf(self)
+        elif visitor.enterBranch(self):
+            for c in self.children:
+                c.accept(visitor)
+            visitor.leaveBranch(self)
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayQuadNode) and other.tree is self.tree and other.index == self.index
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        typ = 'leaf' if self.type == QuadNode.LEAF else 'branch'
+        return "%s [%s] area %s" % (typ, Quater.toString(self.quater), self.area)
+
+#====================================================
+
+class ArrayQuadTree(object):
+    def __init__(self, rect=None, getcoord = lambda x: x,
+                 max_items=100, max_depth=0, min_size=0, min_items=0):
+        """QuadTree that keeps nodes in flat arrays:
+        bounds (x0,y0,x1,y1 per node), index of the first of four consecutive
+        children (-1 for leaves), parent index and number of items in the
+        subtree. Leaves own item buckets, insertion and removal descend
+        iteratively. Parameters are the same as of QuadTree
+        """
+
+        self.max_items = max_items
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.min_items = min_items
+
+        self._getcoord = getcoord
+        self._reset(tuple(Rect(rect) if rect else Rect.INF))
+
+    def _reset(self, bounds):
+        self._bounds = array('d', bounds)
+        self._child = array('i', [-1])
+        self._parent = array('i', [-1])
+        self._count = array('i', [0])
+        self._items = [[]]
+        self._free = []
+
+    @classmethod
+    def from_items(cls, items, rect=None, getcoord = lambda x: x, **kwargs):
+        """Builds tree from all items at once, the result is the same as
+        inserting items one by one"""
+
+        qt = cls(rect, getcoord, **kwargs)
+        items = list(items)
+        coords = np.array([c[:2] for c in map(getcoord, items)], np.float64).reshape(-1, 2)
+
+        x0, y0, x1, y1 = qt._bounds[0:4]
+        xs, ys = coords[:, 0], coords[:, 1]
+        inside = (xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1)
+
+        stack = [(0, np.nonzero(inside)[0], 1)]
+        while stack:
+            node, idx, depth = stack.pop()
+            qt._count[node] = len(idx)
+            if qt.max_items and len(idx) > qt.max_items and qt._canSplit(node, depth):
+                c = qt._allocChildren(node)
+                rest = np.ones(len(idx), bool)
+                x, y = xs[idx], ys[idx]
+                for q in range(4):
+                    cx0, cy0, cx1, cy1 = qt._bounds[(c + q) * 4:(c + q) * 4 + 4]
+                    sel = rest & (x >= cx0) & (x <= cx1) & (y >= cy0) & (y <= cy1)
+                    rest &= ~sel
+                    stack.append((c + q, idx[sel], depth + 1))
+            else:
+                qt._items[node] = [items[i] for i in idx.tolist()]
+
+        return qt
+
+    @property
+    def root(self):
+        return ArrayQuadNode(self, 0)
+
+    @property
+    def area(self):
+        return self._area(0)
+
+    @property
+    def items(self):
+        return self._subtreeItems(0)
+
+    @property
+    def count(self):
+        return self._count[0]
+
+    @property
+    def depth(self):
+        depth = 0
+        stack = [(0, 1)]
+        while stack:
+            node, d = stack.pop()
+            c = self._child[node]
+            if c < 0:
+                depth = max(depth, d)
+            else:
+                stack.extend((c + q, d + 1) for q in range(4))
+        return depth
+
+    def insert(self, item):
+        x, y = self._getcoord(item)[:2]
+        bounds = self._bounds
+        child = self._child
+
+        # depth first search for the first leaf containing the point,
+        # same traversal as InsertionVisitor does
+        stack = [(0, 1)]
+        while stack:
+            node, depth = stack.pop()
+            b = node * 4
+            if x < bounds[b] or x > bounds[b+2] or y < bounds[b+1] or y > bounds[b+3]:
+                continue
+
+            c = child[node]
+            if c >= 0:
+                stack.extend(((c + 3, depth + 1), (c + 2, depth + 1), (c + 1, depth + 1), (c, depth + 1)))
+            elif self.max_items and len(self._items[node]) >= self.max_items and self._canSplit(node, depth):
+                self._split(node)
+                stack.append((node, depth))
+            else:
+                self._items[node].append(item)
+                self._addCount(node, 1)
+                return depth
+        return 0
+
+    def remove(self, item):
+        x, y = self._getcoord(item)[:2]
+        bounds = self._bounds
+        child = self._child
+
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            b = node * 4
+            if x < bounds[b] or x > bounds[b+2] or y < bounds[b+1] or y > bounds[b+3]:
+                continue
+
+            c = child[node]
+            if c >= 0:
+                stack.extend((c + 3, c + 2, c + 1, c))
+                continue
+
+            # only the first leaf containing the point is checked
+            try:
+                self._items[node].remove(item)
+            except ValueError:
+                return False
+            self._addCount(node, -1)
+
+            parent = self._parent[node]
+            while self.min_items and self._count[node] <= self.min_items \
+                                 and parent >= 0 \
+                                 and self._count[parent] <= self.min_items:
+                self._merge(parent)
+                node, parent = parent, self._parent[parent]
+            return True
+        return False
+
+    def clear(self):
+        self._reset(self._bounds[0:4])
+
+    def accept(self, visitor):
+        try:
+            self.root.accept(visitor)
+        except StopIteration:
+            pass
+
+    def query_rect(self, rect):
+        """Yields items which coordinates fall into rect (x0,y0,x1,y1)"""
+        rx0, ry0, rx1, ry1 = Rect(rect)
+        bounds = self._bounds
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            b = node * 4
+            if rx0 > bounds[b+2] or rx1 < bounds[b] or ry0 > bounds[b+3] or ry1 < bounds[b+1]:
+                continue
+            c = self._child[node]
+            if c >= 0:
+                stack.extend((c + 3, c + 2, c + 1, c))
+            else:
+                for i in self._items[node]:
+                    x, y = self._getcoord(i)[:2]
+                    if x >= rx0 and x <= rx1 and y >= ry0 and y <= ry1:
+                        yield i
+
+    def query_radius(self, center, radius):
+        """Yields items within radius of the center point"""
+        r2 = radius * radius
+        cx, cy = center
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._distance2(node, cx, cy) > r2:
+                continue
+            c = self._child[node]
+            if c >= 0:
+                stack.extend((c + 3, c + 2, c + 1, c))
+            else:
+                for i in self._items[node]:
+                    x, y = self._getcoord(i)[:2]
+                    if (x - cx) * (x - cx) + (y - cy) * (y - cy) <= r2:
+                        yield i
+
+    def nearest(self, p, k=1):
+        """Returns list of up to k items closest to point p, nearest first"""
+        px, py = p
+        queue = [(self._distance2(0, px, py), 0, 0, False)]
+        seq = 1
+        res = []
+        while queue and len(res) < k:
+            _, _, entry, is_item = heapq.heappop(queue)
+            if is_item:
+                res.append(entry)
+                continue
+            c = self._child[entry]
+            if c >= 0:
+                for q in range(4):
+                    heapq.heappush(queue, (self._distance2(c + q, px, py), seq, c + q, False))
+                    seq += 1
+            else:
+                for i in self._items[entry]:
+                    x, y = self._getcoord(i)[:2]
+                    heapq.heappush(queue, ((x - px) * (x - px) + (y - py) * (y - py), seq, i, True))
+                    seq += 1
+        return res
+
+    def _area(self, node):
+        return Rect(tuple(self._bounds[node * 4:node * 4 + 4]))
+
+    def _distance2(self, node, px, py):
+        x0, y0, x1, y1 = self._bounds[node * 4:node * 4 + 4]
+        dx = max(x0 - px, 0.0, px - x1)
+        dy = max(y0 - py, 0.0, py - y1)
+        return dx * dx + dy * dy
+
+    def _subtreeItems(self, node):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            c = self._child[n]
+            if c >= 0:
+                stack.extend((c + 3, c + 2, c + 1, c))
+            else:
+                for i in self._items[n]:
+                    yield i
+
+    def _addCount(self, node, n):
+        while node >= 0:
+            self._count[node] += n
+            node = self._parent[node]
+
+    def _canSplit(self, node, depth):
+        x0, y0, x1, y1 = self._bounds[node * 4:node * 4 + 4]
+        return (not self.max_depth or depth < self.max_depth) \
+           and (not self.min_size or ((x1 - x0) * 0.5 >= self.min_size and (y1 - y0) * 0.5 >= self.min_size))
+
+    def _allocChildren(self, node):
+        stats.count('qtree_splits')
+        x0, y0, x1, y1 = self._bounds[node * 4:node * 4 + 4]
+        w2 = (x1 - x0) * 0.5
+        h2 = (y1 - y0) * 0.5
+
+        if self._free:
+            c = self._free.pop()
+        else:
+            c = len(self._child)
+            self._bounds.extend([0.0] * 16)
+            self._child.extend([-1] * 4)
+            self._parent.extend([-1] * 4)
+            self._count.extend([0] * 4)
+            self._items.extend([None] * 4)
+
+        # same arithmetic as Quater.ofArea
+        for q in range(4):
+            cx0 = x0 + w2 * ((q & 2) >> 1)
+            cy0 = y0 + h2 * (q & 1)
+            self._bounds[(c + q) * 4:(c + q) * 4 + 4] = array('d', (cx0, cy0, cx0 + w2, cy0 + h2))
+            self._child[c + q] = -1
+            self._parent[c + q] = node
+            self._count[c + q] = 0
+            self._items[c + q] = []
+
+        self._child[node] = c
+        self._items[node] = None
+        return c
+
+    def _split(self, node):
+        items = self._items[node]
+        c = self._allocChildren(node)
+        bounds = self._bounds
+
+        lost = 0
+        for i in items:
+            x, y = self._getcoord(i)[:2]
+            for q in range(c, c + 4):
+                b = q * 4
+                if x >= bounds[b] and x <= bounds[b+2] and y >= bounds[b+1] and y <= bounds[b+3]:
+                    self._items[q].append(i)
+                    self._count[q] += 1
+                    break
+            else:
+                lost += 1
+
+        if lost:
+            self._addCount(node, -lost)
+
+    def _merge(self, node):
+        stats.count('qtree_merges')
+        items = list(self._subtreeItems(node))
+
+        stack = [self._child[node]]
+        while stack:
+            c = stack.pop()
+            self._free.append(c)
+            for q in range(c, c + 4):
+                if self._child[q] >= 0:
+                    stack.append(self._child[q])
+                self._items[q] = None
+
+        self._child[node] = -1
+        self._items[node] = items
+
+    def __str__(self):
+        v = PrinterVisitor()
+        self.accept(v)
+        return v.str
+
+#====================================================
@@ -1,5 +1,11 @@
 from rect import Rect
 
+try:
+    from .. import stats
+except ValueError:
+    # partition is top level package when tools run as scripts
+    import stats
+
 #====================================================
 
 class GridCell(object):
@@ -32,14 +38,18 @@ class GridCell(object):
 #====================================================
 
 class Grid(object):
-    def __init__(self, area, getcoord = lambda x: x, cell_size=None, cells_num=None):
-        """Grid space partition"""
+    def __init__(self, area, getcoord = lambda x: x, cell_size=None, cells_num=None, sparse=False):
+        """Grid space partition
+        sparse - allocate cells only when first item is inserted into them,
+                 memory is proportional to number of occupied cells
+        """
         
         if (cell_size is None and cells_num is None) \
         or (cell_size is not None and cells_num is not None):
             raise Exception('Specify either cell_size or cells_number')
         
         self.area = Rect(area)
+        self.sparse = sparse
         self._getcoord = getcoord
         
         if cells_num is not None:
@@ -49,10 +59,17 @@ class Grid(object):
     
     @property
     def dimensions(self):
+        if self.sparse:
+            return self._dims
         return (len(self._cells[0]), len(self._cells))
     
     @property
     def cells(self):
+        if self.sparse:
+            # sorted keys are kept until a cell is allocated or freed
+            if self._order is None:
+                self._order = sorted(self._cells, key=lambda k: (k[1], k[0]))
+            return (self._cells[k] for k in self._order)
         return (c for cy in self._cells for c in cy)
     
     @property
@@ -61,15 +78,25 @@ class Grid(object):
     
     @property
     def count(self):
+        if self.sparse:
+            return sum( (c.count for c in self._cells.itervalues()) )
         return sum( (c.count for c in self.cells) )
     
     def __getitem__(self, xy):
+        if self.sparse:
+            xy = tuple(xy)
+            cell = self._cells.get(xy)
+            return cell if cell is not None else GridCell(self, xy)
         return self._cells[xy[1]][xy[0]]
     
     def insert(self, item):
         cell = self.getCell(self._getcoord(item))
         if not cell:
             return None
+        if self.sparse and cell.index not in self._cells:
+            stats.count('grid_cells')
+            self._cells[cell.index] = cell
+            self._order = None
         cell.insert(item)
         return cell.index
     
@@ -77,7 +104,12 @@ class Grid(object):
         cell = self.getCell(self._getcoord(item))
         if not cell:
             return None
-        return cell.index if cell.remove(item) else None
+        if not cell.remove(item):
+            return None
+        if self.sparse and not cell.count:
+            del self._cells[cell.index]
+            self._order = None
+        return cell.index
     
     def clear(self):
         self._cells = self._createGridFromNum(self.dimensions)
@@ -93,15 +125,40 @@ class Grid(object):
             return None
         return self[cx, cy]
     
-    def _createGridFromNum(self, cells_num):
-        cn = None
+    def query_rect(self, rect):
+        """Yields items which coordinates fall into rect (x0,y0,x1,y1)"""
+        rect = Rect(rect)
+        nx,ny = self.dimensions
+        
+        cx0 = max(int((rect[0] - self.area[0]) / self.area.width * nx), 0)
+        cy0 = max(int((rect[1] - self.area[1]) / self.area.height * ny), 0)
+        cx1 = min(int((rect[2] - self.area[0]) / self.area.width * nx), nx - 1)
+        cy1 = min(int((rect[3] - self.area[1]) / self.area.height * ny), ny - 1)
+        
+        if self.sparse and (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            cells = [c for c in self.cells if cx0 <= c.index[0] <= cx1 and cy0 <= c.index[1] <= cy1]
+        else:
+            cells = (self[cx, cy] for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1))
+        
+        for c in cells:
+            for i in c.items:
+                if rect.contains(self._getcoord(i)):
+                    yield i
+    
+    def _cellsNum(self, cells_num):
         if isinstance(cells_num, tuple) and cells_num[0] > 0 and cells_num[1] > 0:
-            cn = cells_num
+            return cells_num
         elif isinstance(cells_num, int) and cells_num > 0:
-            cn = (cells_num, cells_num)
+            return (cells_num, cells_num)
         else:
             raise Exception('Cells number should be tuple or int')
-        
+    
+    def _createGridFromNum(self, cells_num):
+        cn = self._cellsNum(cells_num)
+        if self.sparse:
+            self._dims = cn
+            self._order = None
+            return {}
         grid = [ [ GridCell(self, (x,y)) for x in range(cn[0]) ] for y in range(cn[1])]
         return grid
     
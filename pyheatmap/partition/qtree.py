@@ -1,4 +1,12 @@
 from rect import Rect
+import numpy as np
+import heapq
+
+try:
+    from .. import stats
+except ValueError:
+    # partition is top level package when tools run as scripts
+    import stats
 
 #====================================================
 
@@ -83,6 +91,7 @@ class QuadLeaf(QuadNode):
         self._items = []
     
     def split(self):
+        stats.count('qtree_splits')
         br = QuadBranch(self.parent, self.area)
         self.parent._wasSplit(self, br)
         return br
@@ -129,6 +138,7 @@ class QuadBranch(QuadNode):
         self._children = [QuadLeaf(self, Quater.ofArea(self.area, q)) for q in range(4)]
     
     def merge(self):
+        stats.count('qtree_merges')
         leaf = QuadLeaf(self.parent, self.area)
         self.parent._wasMerged(self, leaf)
         return leaf
@@ -321,6 +331,41 @@ class QuadTree(object):
         self._inserter = inserter(self._getcoord, self.max_items, self.max_depth, self.min_size)
         self._remover = remover(self._getcoord, self.min_items)
     
+    @classmethod
+    def from_items(cls, items, rect=None, getcoord = lambda x: x, **kwargs):
+        """Builds tree from all items at once, the result is the same as
+        inserting items one by one, see QuadTree for parameters"""
+        
+        qt = cls(rect, getcoord, **kwargs)
+        items = list(items)
+        coords = np.array([c[:2] for c in map(getcoord, items)], np.float64).reshape(-1, 2)
+        
+        area = qt.area
+        xs, ys = coords[:, 0], coords[:, 1]
+        inside = (xs >= area[0]) & (xs <= area[2]) & (ys >= area[1]) & (ys <= area[3])
+        
+        qt._bulkLoad(qt._root, items, xs, ys, np.nonzero(inside)[0], 1)
+        return qt
+    
+    def _bulkLoad(self, leaf, items, xs, ys, idx, depth):
+        # same splitting rule as InsertionVisitor.splitInsert applies
+        # when the leaf receives one item more than max_items
+        if self.max_items and len(idx) > self.max_items \
+        and (not self.max_depth or depth < self.max_depth) \
+        and (not self.min_size or (leaf.area.width * 0.5 >= self.min_size and leaf.area.height * 0.5 >= self.min_size)):
+            br = leaf.split()
+            
+            # items go to the first child containing them like on split
+            rest = np.ones(len(idx), bool)
+            x, y = xs[idx], ys[idx]
+            for c in br.children:
+                r = c.area
+                sel = rest & (x >= r[0]) & (x <= r[2]) & (y >= r[1]) & (y <= r[3])
+                rest &= ~sel
+                self._bulkLoad(c, items, xs, ys, idx[sel], depth + 1)
+        else:
+            leaf._items = [items[i] for i in idx.tolist()]
+    
     @property
     def root(self):
         return self._root
@@ -358,6 +403,60 @@ class QuadTree(object):
     def clear(self):
         self._root = QuadLeaf(self, self.area)
     
+    def query_rect(self, rect):
+        """Yields items which coordinates fall into rect (x0,y0,x1,y1)"""
+        rect = Rect(rect)
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.area.intersects(rect):
+                continue
+            if node.type == QuadNode.BRANCH:
+                stack.extend(reversed(node.children))
+            else:
+                for i in node.items:
+                    if rect.contains(self._getcoord(i)):
+                        yield i
+    
+    def query_radius(self, center, radius):
+        """Yields items within radius of the center point"""
+        r2 = radius * radius
+        cx, cy = center
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.area.distance2(center) > r2:
+                continue
+            if node.type == QuadNode.BRANCH:
+                stack.extend(reversed(node.children))
+            else:
+                for i in node.items:
+                    x, y = self._getcoord(i)
+                    if (x - cx) * (x - cx) + (y - cy) * (y - cy) <= r2:
+                        yield i
+    
+    def nearest(self, p, k=1):
+        """Returns list of up to k items closest to point p, nearest first"""
+        px, py = p
+        # best-first search, nodes and items share the queue ordered by distance
+        queue = [(self._root.area.distance2(p), 0, self._root, False)]
+        seq = 1
+        res = []
+        while queue and len(res) < k:
+            _, _, entry, is_item = heapq.heappop(queue)
+            if is_item:
+                res.append(entry)
+            elif entry.type == QuadNode.BRANCH:
+                for c in entry.children:
+                    heapq.heappush(queue, (c.area.distance2(p), seq, c, False))
+                    seq += 1
+            else:
+                for i in entry.items:
+                    x, y = self._getcoord(i)
+                    heapq.heappush(queue, ((x - px) * (x - px) + (y - py) * (y - py), seq, i, True))
+                    seq += 1
+        return res
+    
     def accept(self, visitor):
         try:
             self._root.accept(visitor)
@@ -31,6 +31,17 @@ class Rect(object):
         r = self._r
         return p[0] >= r[0] and p[0] <= r[2] and p[1] >= r[1] and p[1] <= r[3]
     
+    def intersects(self, other):
+        r, o = self._r, other._r
+        return o[0] <= r[2] and o[2] >= r[0] and o[1] <= r[3] and o[3] >= r[1]
+    
+    def distance2(self, p):
+        """Squared distance from point to the closest point of rect"""
+        r = self._r
+        dx = max(r[0] - p[0], 0.0, p[0] - r[2])
+        dy = max(r[1] - p[1], 0.0, p[1] - r[3])
+        return dx * dx + dy * dy
+    
     def __eq__(self, tpl):
         other = Rect(tpl)
         for i in range(4):
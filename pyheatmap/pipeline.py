@@ -0,0 +1,85 @@
+from PIL import Image
+
+from heatmap import Heatmap
+from mapcoords import normalize_batch
+import heataccum
+import kernels
+import pointio
+import stats
+
+#====================================================
+
+def normalize(batches, area):
+    """Normalizes stream of (n, 3) point arrays, same as mapcoords.py does"""
+    for batch in batches:
+        yield normalize_batch(batch, area)
+
+def accumulate(batches, grid=(100, 100), error=None, sparse=None):
+    """
+    Collapses normalized points into grid cells, same as heataccum.py does,
+    returns (n, 3) array of points with weights normalized to [0, 1]
+    """
+    dims = grid if not error else None
+    return heataccum.accumulate(batches, cells_num=dims, cell_size=error, sparse=sparse).normalizedPoints()
+
+def render(points, area, palette, grid=(100, 100), error=None, size=None, background=None,
+           dotsize=150, opacity=0.9, engine='numpy', **kwargs):
+    """
+    Runs normalize -> accumulate -> render chain of run.sh in one process,
+    points are passed between stages as (n, 3) arrays.
+
+    points  -> iterable of raw (x,y[,w]) tuples or point arrays
+    area    -> bounding rect of raw coordinates (x0,y0,x1,y1)
+    grid    -> number of x,y accumulation cells
+    error   -> accumulation cell size in normalized units, overrides grid
+    other parameters are passed to Heatmap.create
+    """
+    heat = accumulate(normalize(pointio.batches(points), area), grid, error)
+    return Heatmap().create(points=[heat], palette=palette, size=size, dotsize=dotsize, opacity=opacity,
+                            background=background, engine=engine, **kwargs)
+
+#====================================================
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Normalizes, accumulates and draws heatmap from CSV or binary files or stdin in one go')
+    parser.add_argument('--area', dest="area", help="bounding rect of event coordinates (x0,y0,x1,y1)", default='0,0,1,1')
+    parser.add_argument('--grid', dest="grid", help="Number of x,y grid cells for subdivision", default='100,100')
+    parser.add_argument('--error', dest="error", help="maximum error allowed (in normalized units)", type=float, default=None)
+    parser.add_argument('--palette', dest="palette", help="palette file for color mapping", default='resources/palette.png')
+    parser.add_argument('--bg', dest="background", help="background file name")
+    parser.add_argument('--size', dest="size", help="size of image h,w if not using background", default="800,600")
+    parser.add_argument('--dotsize', dest="dotsize", help="size of the heat dot", default=100, type=int)
+    parser.add_argument('--opacity', dest="opacity", help="opacity of the heat layer", default=0.9, type=float)
+    parser.add_argument('--out', dest="output", help="specifies output file name", default="heatmap.jpg")
+    parser.add_argument('--engine', dest="engine", help="mask building engine", choices=Heatmap.ENGINES, default='numpy')
+    parser.add_argument('--kernel', dest="kernel", help="shape of the heat dot", choices=kernels.SHAPES, default='linear')
+    parser.add_argument('--falloff', dest="falloff", help="relative radius at which dot strength reaches zero", default=1.0, type=float)
+    parser.add_argument('--scale', dest="scale", help="accumulate without clipping and normalize heat using given scale", choices=Heatmap.SCALES, default=None)
+    parser.add_argument('--stats', dest="stats", help="write stage timings and counters as JSON into file, - for stderr", default=None)
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
+
+    args = parser.parse_args(argv)
+    area = tuple(map(float, args.area.split(',')))
+    grid = tuple(map(int, args.grid.split(',')))
+    size = tuple(map(int, args.size.split(',')))
+    background = Image.open(args.background) if args.background else None
+
+    if args.stats:
+        stats.enable()
+    points = pointio.read_points(args.file)
+
+    try:
+        img = render(points, area, args.palette, grid=grid, error=args.error, size=size,
+                     background=background, dotsize=args.dotsize, opacity=args.opacity,
+                     engine=args.engine, scale=args.scale, kernel=args.kernel, falloff=args.falloff)
+        with stats.stage('encode'):
+            img.save(args.output, 'JPEG')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.stats:
+            stats.save(args.stats)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,469 @@
+import numpy as np
+from itertools import islice
+import struct
+import re
+import sys
+import os
+
+#====================================================
+
+# size of text blocks parsed at once
+BLOCK_SIZE = 1 << 22
+
+# values of the optional columns: weight, timestamp (unknown)
+DEFAULTS = (0.0, 0.0, 1.0, float('nan'))
+
+# binary format: 16 bytes header (magic, version, record type code and
+# number of columns) followed by packed little endian float records
+MAGIC = 'PHMP'
+VERSION = 1
+HEADER = struct.Struct('<4sBcB9x')
+DTYPES = { 'f' : np.dtype('<f4'), 'd' : np.dtype('<f8') }
+
+# output formats
+FORMATS = ('csv', 'bin32', 'bin64')
+
+# number of binary records read at once
+BLOCK_ROWS = 1 << 18
+
+# approximate size of file shards processed independently
+SHARD_SIZE = 1 << 26
+
+# line without visible characters, it terminates text input
+_BLANK_LINE = re.compile(r'[ \t\r\v\f]*\n')
+_BLANK_AFTER = re.compile(r'\n[ \t\r\v\f]*\n')
+
+#====================================================
+
+def read_stream(s, ncols=3, min_cols=2, block_size=BLOCK_SIZE, lineno=0):
+    """
+    Parses "x,y[,weight]" text stream in large blocks and yields (n, ncols)
+    float arrays, missing optional columns get DEFAULTS values.
+    Reading stops at the end of stream or at the first empty line,
+    lineno is the number of lines preceding the stream used in errors
+    """
+    carry = ''
+    while True:
+        data = s.read(block_size)
+        eof = not data
+        text = carry + data
+
+        end = len(text) if eof else text.rfind('\n') + 1
+        text, carry = text[:end], text[end:]
+        if not text:
+            if eof:
+                break
+            continue
+
+        batch, nlines, stop = _parseBlock(text, ncols, min_cols, lineno)
+        lineno += nlines
+        if len(batch):
+            yield batch
+        if stop or eof:
+            break
+
+def read_csv(filenames, ncols=3, min_cols=2, block_size=BLOCK_SIZE):
+    for fname in filenames:
+        with open(fname, 'rb') as f:
+            for v in read_stream(f, ncols, min_cols, block_size):
+                yield v
+
+def read_binary(s, ncols=3, min_cols=2, head=None):
+    """Reads binary point stream yielding (n, ncols) float arrays"""
+    dtype, cols = _readHeader(head or _readExactly(s, HEADER.size), ncols, min_cols)
+    rec_size = dtype.itemsize * cols
+    carry = ''
+    while True:
+        data = s.read(BLOCK_ROWS * rec_size)
+        if not data:
+            break
+        data = carry + data
+        end = len(data) - len(data) % rec_size
+        data, carry = data[:end], data[end:]
+        if data:
+            yield _widen(np.frombuffer(data, dtype).reshape(-1, cols), ncols)
+
+    if carry:
+        raise Exception("Truncated binary record at the end of stream")
+
+def map_binary(fname, ncols=3, min_cols=2, start=None, end=None):
+    """
+    Memory maps binary point file yielding (n, ncols) float arrays,
+    only the current block of records is loaded into memory.
+    start and end limit reading to the byte range of records
+    """
+    with open(fname, 'rb') as f:
+        dtype, cols = _readHeader(f.read(HEADER.size), ncols, min_cols)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+
+    start = HEADER.size if start is None else start
+    end = size if end is None else end
+    rec_size = dtype.itemsize * cols
+    if (end - start) % rec_size:
+        raise Exception("Truncated binary record at the end of file %s" % (fname))
+    if end <= start:
+        return
+
+    data = np.memmap(fname, np.uint8, mode='r', offset=start, shape=(end - start,))
+    records = data.view(dtype).reshape(-1, cols)
+    for i in range(0, len(records), BLOCK_ROWS):
+        yield _widen(records[i:i + BLOCK_ROWS], ncols)
+
+def shards(filenames, size=None, format='auto'):
+    """
+    Splits files into (fname, start, end, binary, lineno) byte ranges of
+    about given size, text ranges hold whole lines and binary ones whole
+    records, lineno is the number of text lines before the range. Text
+    files are scanned once to end the last range at the first empty line
+    like read_stream does. Ranges depend on the files only, so they can be
+    processed in any number of processes with the same result
+    """
+    size = size or SHARD_SIZE
+    for fname in filenames:
+        with open(fname, 'rb') as f:
+            binary = _isBinary(f.read(len(MAGIC)), format)
+            f.seek(0)
+            if binary:
+                dtype, cols = _readHeader(f.read(HEADER.size))
+                f.seek(0, os.SEEK_END)
+                total = f.tell()
+                step = max(size // (dtype.itemsize * cols), 1) * dtype.itemsize * cols
+                bounds = [(start, 0) for start in range(HEADER.size, total, step)] + [(total, 0)]
+            else:
+                bounds = _textBounds(f, size)
+
+        for (start, lineno), (end, _) in zip(bounds[:-1], bounds[1:]):
+            yield (fname, start, end, binary, lineno)
+
+def read_shard(shard, ncols=3, min_cols=2):
+    """Reads points from the byte range produced by shards()"""
+    fname, start, end, binary, lineno = shard
+    if binary:
+        for v in map_binary(fname, ncols, min_cols, start, end):
+            yield v
+        return
+
+    with open(fname, 'rb') as f:
+        f.seek(start)
+        for v in read_stream(_Limited(f, end - start), ncols, min_cols, lineno=lineno):
+            yield v
+
+def read_points(filenames, stream=None, ncols=3, min_cols=2, format='auto'):
+    """
+    Reads points from the list of files or from stream (stdin by default).
+    format is 'csv', 'bin' or 'auto' to detect binary input by its header,
+    binary files are memory mapped
+    """
+    if format not in ('auto', 'csv', 'bin'):
+        raise Exception("Unknown input format '%s'" % (format))
+
+    if filenames:
+        return _readFiles(filenames, ncols, min_cols, format)
+    return _readStream(stream or sys.stdin, ncols, min_cols, format)
+
+def is_binary(fname):
+    """Returns True if file starts with the header of binary point format"""
+    with open(fname, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _readFiles(filenames, ncols, min_cols, format):
+    for fname in filenames:
+        with open(fname, 'rb') as f:
+            binary = _isBinary(f.read(len(MAGIC)), format)
+        if binary:
+            reader = map_binary(fname, ncols, min_cols)
+        else:
+            reader = read_csv([fname], ncols, min_cols)
+        for v in reader:
+            yield v
+
+def _readStream(s, ncols, min_cols, format):
+    if format == 'csv':
+        return read_stream(s, ncols, min_cols)
+
+    head = _readExactly(s, len(MAGIC))
+    if _isBinary(head, format):
+        return read_binary(s, ncols, min_cols, head + _readExactly(s, HEADER.size - len(head)))
+    return read_stream(_Prefixed(head, s), ncols, min_cols)
+
+def _textBounds(f, size):
+    # (offset, lineno) of range starts and of the end of text, a range
+    # ends after the line containing its size-th byte like readline does
+    bounds = [(0, 0)]
+    pos = lineno = 0
+    cut = size
+    carry = ''
+    while True:
+        data = f.read(BLOCK_SIZE)
+        text = carry + data
+        end = len(text) if not data else text.rfind('\n') + 1
+        text, carry = text[:end], text[end:]
+
+        # the first line is checked separately, searching after newlines is faster
+        blank = _BLANK_LINE.match(text) or _BLANK_AFTER.search(text)
+        if blank:
+            text = text[:blank.start() if blank.re is _BLANK_LINE else blank.start() + 1]
+        elif not data and not text.strip():
+            text = ''
+
+        last = 0
+        while cut < pos + len(text):
+            nl = text.find('\n', cut - pos)
+            if nl < 0:
+                break
+            lineno += text.count('\n', last, nl + 1)
+            last = nl + 1
+            bounds.append((pos + last, lineno))
+            cut = pos + last + size
+        lineno += text.count('\n', last)
+        pos += len(text)
+
+        if blank or not data:
+            break
+
+    if bounds[-1][0] == pos:
+        bounds.pop()
+    bounds.append((pos, lineno))
+    return bounds
+
+def _readExactly(s, size):
+    # unbuffered streams may return less data than requested
+    data = s.read(size)
+    while data and len(data) < size:
+        more = s.read(size - len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+def _isBinary(head, format):
+    if format == 'bin' and head != MAGIC:
+        raise Exception("Input is not in binary point format")
+    return head == MAGIC and format != 'csv'
+
+def _readHeader(data, ncols=None, min_cols=1):
+    if len(data) != HEADER.size:
+        raise Exception("Truncated binary header")
+
+    magic, version, code, cols = HEADER.unpack(data)
+    if magic != MAGIC or version != VERSION or code not in DTYPES:
+        raise Exception("Unsupported binary point format")
+    if cols < min_cols or (ncols and cols > ncols):
+        raise Exception("Invalid data length: %d columns in binary input" % (cols))
+    return DTYPES[code], cols
+
+class _Prefixed(object):
+    """Stream with already consumed head put back"""
+
+    def __init__(self, head, s):
+        self.head = head
+        self.s = s
+
+    def read(self, size):
+        head, self.head = self.head, ''
+        return head + self.s.read(size - len(head)) if head else self.s.read(size)
+
+class _Limited(object):
+    """Stream that ends after given number of bytes"""
+
+    def __init__(self, s, size):
+        self.s = s
+        self.left = size
+
+    def read(self, size):
+        data = self.s.read(min(size, self.left))
+        self.left -= len(data)
+        return data
+
+def _parseBlock(text, ncols, min_cols, lineno):
+    if '\r' in text:
+        text = text.replace('\r', '')
+    if not text.endswith('\n'):
+        text += '\n'
+
+    buf = np.frombuffer(text, np.uint8)
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    commas = np.flatnonzero(buf == ord(','))
+    fields = np.searchsorted(commas, ends) - np.searchsorted(commas, starts) + 1
+
+    # the first line without any visible characters terminates the stream,
+    # only lines without commas may be empty
+    stop = False
+    for i in np.flatnonzero(fields == 1).tolist():
+        if not text[starts[i]:ends[i]].strip():
+            text = text[:starts[i]]
+            ends, starts, fields = ends[:i], starts[:i], fields[:i]
+            stop = True
+            break
+
+    nlines = len(ends)
+    if not nlines:
+        return np.zeros((0, ncols)), 0, stop
+
+    invalid = np.flatnonzero((fields < min_cols) | (fields > ncols))
+    if len(invalid):
+        i = invalid[0]
+        raise Exception("Invalid data length at line %d: %s" % (lineno + i + 1, text[starts[i]:ends[i]].strip()))
+
+    values = np.fromstring(text.replace('\n', ','), sep=',')
+    if len(values) != fields.sum():
+        _raiseInvalidValue(text, lineno)
+
+    if (fields == ncols).all():
+        return values.reshape(-1, ncols), nlines, stop
+
+    batch = np.empty((nlines, ncols))
+    offsets = np.cumsum(fields) - fields
+    for c in range(ncols):
+        has = fields > c
+        batch[:, c] = DEFAULTS[c]
+        batch[has, c] = values[offsets[has] + c]
+    return batch, nlines, stop
+
+def _raiseInvalidValue(text, lineno):
+    for i, l in enumerate(text.split('\n')):
+        try:
+            map(float, l.split(','))
+        except ValueError:
+            raise Exception("Invalid value at line %d: %s" % (lineno + i + 1, l.strip()))
+    raise Exception("Invalid data near line %d" % (lineno + 1))
+
+#====================================================
+
+def batches(points, size=65536, ncols=3):
+    """
+    Groups stream of (x,y[,w[,t]]) tuples and/or (n, k) arrays into
+    (n, ncols) float arrays, missing columns get DEFAULTS values
+    """
+    it = iter(points)
+    pending = []
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            break
+
+        for p in chunk:
+            if isinstance(p, np.ndarray) and p.ndim == 2:
+                if pending:
+                    yield _fromTuples(pending, ncols)
+                    pending = []
+                yield p if p.shape[1] == ncols else _widen(p, ncols)
+            else:
+                pending.append(p)
+
+        if len(pending) >= size:
+            yield _fromTuples(pending, ncols)
+            pending = []
+
+    if pending:
+        yield _fromTuples(pending, ncols)
+
+def rows(points):
+    """Iterates stream of tuples and/or arrays as tuples"""
+    for p in points:
+        if isinstance(p, np.ndarray) and p.ndim == 2:
+            for r in p.tolist():
+                yield tuple(r)
+        else:
+            yield p
+
+def _fromTuples(chunk, ncols=3):
+    batch = np.empty((len(chunk), ncols))
+    batch[:] = DEFAULTS[:ncols]
+    for i, p in enumerate(chunk):
+        batch[i, :len(p)] = p[:ncols]
+    return batch
+
+def _widen(batch, ncols):
+    res = np.empty((len(batch), ncols))
+    res[:] = DEFAULTS[:ncols]
+    k = min(ncols, batch.shape[1])
+    res[:, :k] = batch[:, :k]
+    return res
+
+#====================================================
+
+class PointWriter(object):
+    def __init__(self, stream, buffer_size=1 << 20):
+        """Writes points as CSV lines collecting output into large chunks"""
+
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+
+    def write(self, points):
+        """Writes (n, k) array or sequence of tuples"""
+        if isinstance(points, np.ndarray):
+            points = points.tolist()
+        if not len(points):
+            return
+
+        fmt = ','.join(['%s'] * len(points[0]))
+        text = '\n'.join([fmt % tuple(p) for p in points])
+        self._chunks.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._chunks:
+            self.stream.write('\n'.join(self._chunks) + '\n')
+            self._chunks = []
+            self._size = 0
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#====================================================
+
+class BinaryWriter(object):
+    def __init__(self, stream, dtype='d', ncols=3):
+        """Writes points as packed float32 ('f') or float64 ('d') records"""
+
+        if dtype not in DTYPES:
+            raise Exception("Unknown record type '%s'" % (dtype))
+
+        self.stream = stream
+        self.dtype = dtype
+        self.ncols = ncols
+        self.stream.write(HEADER.pack(MAGIC, VERSION, dtype, ncols))
+
+    def write(self, points):
+        """Writes (n, k) array or sequence of tuples, k <= ncols"""
+        points = np.asarray(points, np.float64)
+        if not len(points):
+            return
+        points = _widen(points.reshape(len(points), -1), self.ncols)
+        self.stream.write(points.astype(DTYPES[self.dtype]).tostring())
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def openWriter(stream, format='csv', ncols=3):
+    """Creates point writer for one of FORMATS"""
+    if format == 'csv':
+        return PointWriter(stream)
+    if format == 'bin32':
+        return BinaryWriter(stream, 'f', ncols)
+    if format == 'bin64':
+        return BinaryWriter(stream, 'd', ncols)
+    raise Exception("Unknown output format '%s'" % (format))
@@ -0,0 +1,140 @@
+import numpy as np
+import math
+
+# Web Mercator sphere radius and the latitude where the map becomes square
+EARTH_RADIUS = 6378137.0
+MERCATOR_MAX_LAT = 85.0511287798
+
+_RAD = math.pi / 180.0
+
+#====================================================
+
+class Projection(object):
+    """
+    Base of projections transforming x,y columns of (n, k) point arrays in
+    place with project(batch), geographic projections expect longitude in
+    x and latitude in y
+    """
+
+    def bounds(self, area):
+        """Returns bounding rect of projected corners of area (x0,y0,x1,y1)"""
+        x0, y0, x1, y1 = area
+        corners = self.project(np.array([[x0, y0], [x0, y1], [x1, y0], [x1, y1]], np.float64))
+        lo, hi = corners.min(0), corners.max(0)
+        return (lo[0], lo[1], hi[0], hi[1])
+
+    def normalizer(self, area):
+        """
+        Returns function projecting and normalizing x,y columns of (n, k)
+        array in place, so that projected area falls into [0, 1] range.
+        Constants are computed once for the area
+        """
+        x0, y0, x1, y1 = self.bounds(area)
+        kx = 1.0 / (x1 - x0)
+        ky = 1.0 / (y1 - y0)
+
+        def normalize(batch):
+            self.project(batch)
+            batch[:,0] = (batch[:,0] - x0) * kx
+            batch[:,1] = (batch[:,1] - y0) * ky
+            return batch
+        return normalize
+
+#====================================================
+
+class MercatorProjection(Projection):
+    """Web Mercator, projects lon/lat degrees into meters"""
+
+    def project(self, batch):
+        batch[:,0] *= EARTH_RADIUS * _RAD
+        batch[:,1] = EARTH_RADIUS * _mercatorY(batch[:,1])
+        return batch
+
+    def normalizer(self, area):
+        # x is linear in longitude, so radius and radians cancel out
+        x0, y0, x1, y1 = area
+        m0, m1 = _mercatorY(np.array([y0, y1], np.float64))
+        kx = 1.0 / (x1 - x0)
+        ky = 1.0 / (m1 - m0)
+
+        def normalize(batch):
+            batch[:,0] = (batch[:,0] - x0) * kx
+            batch[:,1] = (_mercatorY(batch[:,1]) - m0) * ky
+            return batch
+        return normalize
+
+class EquirectProjection(Projection):
+    def __init__(self, lat0=0.0):
+        """Equirectangular projection of lon/lat degrees into meters with standard parallel lat0"""
+        self.lat0 = lat0
+        self._kx = EARTH_RADIUS * _RAD * math.cos(lat0 * _RAD)
+
+    def project(self, batch):
+        batch[:,0] *= self._kx
+        batch[:,1] *= EARTH_RADIUS * _RAD
+        return batch
+
+    def normalizer(self, area):
+        # axes are scaled uniformly, so normalizing degrees gives the same result
+        x0, y0, x1, y1 = area
+        kx = 1.0 / (x1 - x0)
+        ky = 1.0 / (y1 - y0)
+
+        def normalize(batch):
+            batch[:,0] = (batch[:,0] - x0) * kx
+            batch[:,1] = (batch[:,1] - y0) * ky
+            return batch
+        return normalize
+
+class AffineProjection(Projection):
+    def __init__(self, a, b, c, d, e, f):
+        """Affine transform x' = a*x + b*y + c, y' = d*x + e*y + f"""
+        self.matrix = np.array([[a, b, c], [d, e, f]], np.float64)
+        if not np.linalg.det(self.matrix[:,:2]):
+            raise Exception("Affine transform is degenerate")
+
+    def project(self, batch):
+        return _transform(batch, self.matrix)
+
+    def normalizer(self, area):
+        # normalization is folded into the transform matrix
+        x0, y0, x1, y1 = self.bounds(area)
+        scale = np.array([[1.0 / (x1 - x0)], [1.0 / (y1 - y0)]])
+        matrix = (self.matrix - [[0.0, 0.0, x0], [0.0, 0.0, y0]]) * scale
+        return lambda batch: _transform(batch, matrix)
+
+#====================================================
+
+PROJECTIONS = {
+    'mercator' : MercatorProjection,
+    'equirect' : EquirectProjection,
+    'affine' : AffineProjection,
+}
+
+NAMES = tuple(sorted(PROJECTIONS))
+
+def createProjection(spec):
+    """
+    Creates projection from 'name[:param,...]' string, e.g. 'mercator',
+    'equirect:45' (standard parallel) or 'affine:a,b,c,d,e,f'
+    """
+    name, _, params = spec.partition(':')
+    if name not in PROJECTIONS:
+        raise Exception("Unknown projection '%s'" % (name))
+
+    try:
+        params = [float(p) for p in params.split(',')] if params else []
+        return PROJECTIONS[name](*params)
+    except (TypeError, ValueError):
+        raise Exception("Invalid parameters of projection '%s'" % (spec))
+
+def _mercatorY(lat):
+    lat = np.clip(lat, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)
+    return np.log(np.tan(math.pi / 4 + lat * (_RAD / 2)))
+
+def _transform(batch, matrix):
+    x = batch[:,0].copy()
+    y = batch[:,1]
+    batch[:,0] = matrix[0,0] * x + matrix[0,1] * y + matrix[0,2]
+    batch[:,1] = matrix[1,0] * x + matrix[1,1] * y + matrix[1,2]
+    return batch
@@ -0,0 +1,193 @@
+import numpy as np
+import math
+
+import pointio
+
+#====================================================
+
+def toPixels(batch, size):
+    """
+    Maps normalized coordinates to integer pixel positions,
+    Y axis points up in normalized space and down in image space
+    """
+    px = (batch[:, 0] * size[0]).astype(np.int64)
+    py = ((1.0 - batch[:, 1]) * size[1]).astype(np.int64)
+    return px, py
+
+def quantizeWeights(ws):
+    """Converts weights into 8-bit dot strength the way PIL engine does"""
+    return np.clip((ws * 255).astype(np.int64), 0, 255)
+
+#====================================================
+
+def splat(acc, px, py, ws, dot, quantize=True, subtract=False):
+    """
+    Accumulates dot kernel into acc array (h, w) centered at pixel positions.
+
+    acc      -> 2D array that receives the sum of all dots, it is not clipped
+    px, py   -> integer pixel positions of the points
+    ws       -> point weights
+    dot      -> 2D kernel array, values in range [0, 255]
+    quantize -> reproduce 8-bit arithmetic of the PIL engine, i.e. each dot
+                pixel is (dot * int(w * 255)) / 255 rounded down
+    subtract -> remove dots splatted before instead of adding them
+    """
+    h, w = acc.shape
+    kh, kw = dot.shape
+    ds_2 = kw // 2
+
+    x0 = px - ds_2
+    y0 = py - ds_2
+    visible = (x0 > -kw) & (x0 < w) & (y0 > -kh) & (y0 < h)
+    x0, y0, ws = x0[visible], y0[visible], ws[visible]
+    if not len(ws):
+        return
+
+    # points sharing position (and 8-bit weight) are splatted once
+    stride = w + kw
+    pos = (y0 + kh) * stride + (x0 + kw)
+    if quantize:
+        key, amount = np.unique(pos * 256 + quantizeWeights(ws), return_counts=True)
+        key, level = np.divmod(key, 256)
+    else:
+        key, inv = np.unique(pos, return_inverse=True)
+        amount = np.bincount(inv, weights=ws)
+        level = np.zeros(len(key), np.int64)
+    y0, x0 = np.divmod(key, stride)
+    y0 -= kh
+    x0 -= kw
+
+    # dot footprint clipped to the accumulator bounds
+    ax0 = np.maximum(x0, 0)
+    ay0 = np.maximum(y0, 0)
+    ax1 = np.minimum(x0 + kw, w)
+    ay1 = np.minimum(y0 + kh, h)
+    kx0 = ax0 - x0
+    ky0 = ay0 - y0
+    kx1 = kx0 + ax1 - ax0
+    ky1 = ky0 + ay1 - ay0
+
+    kernels = {}
+    rows = zip(ax0.tolist(), ay0.tolist(), ax1.tolist(), ay1.tolist(),
+               kx0.tolist(), ky0.tolist(), kx1.tolist(), ky1.tolist(),
+               level.tolist(), amount.tolist())
+
+    for ax0, ay0, ax1, ay1, kx0, ky0, kx1, ky1, l, n in rows:
+        k = kernels.get(l)
+        if k is None:
+            if quantize:
+                k = (dot.astype(np.int64) * l // 255).astype(acc.dtype)
+            else:
+                k = dot.astype(acc.dtype)
+            kernels[l] = k
+
+        region = k[ky0:ky1, kx0:kx1]
+        if subtract:
+            acc[ay0:ay1, ax0:ax1] -= region if n == 1 else region * n
+        else:
+            acc[ay0:ay1, ax0:ax1] += region if n == 1 else region * n
+
+def splatPoints(acc, points, dot, quantize=True):
+    """Splats stream of normalized points into acc array"""
+    h, w = acc.shape
+    for batch in pointio.batches(points):
+        px, py = toPixels(batch, (w, h))
+        splat(acc, px, py, batch[:, 2], dot, quantize)
+    return acc
+
+#====================================================
+
+# cost of forward and inverse FFT in full-image passes per log2(pixels),
+# one pass is a single multiply-add of shifted image
+FFT_PASSES = 2.0
+
+def histogram(hist, px, py, ws, dot):
+    """
+    Bins points into hist array by the position of the dot top left corner.
+    hist has (h + kh - 1, w + kw - 1) shape for (h, w) image, so it also
+    holds points outside of the image that still touch it with their dots
+    """
+    hh, hw = hist.shape
+    kh, kw = dot.shape
+
+    hx = px - kw // 2 + kw - 1
+    hy = py - kw // 2 + kh - 1
+    inside = (hx >= 0) & (hx < hw) & (hy >= 0) & (hy < hh)
+
+    idx = hy[inside] * hw + hx[inside]
+    hist += np.bincount(idx, weights=ws[inside], minlength=hh * hw).reshape(hh, hw)
+
+def convolve(hist, dot, size):
+    """
+    Spreads histogram with dot kernel and returns (h, w) image of accumulated
+    heat. Uses separable convolution of kernel rank components for small
+    low-rank kernels and FFT otherwise
+    """
+    w, h = size
+    kh, kw = dot.shape
+    kernel = dot.astype(np.float64)
+
+    u, s, vt = np.linalg.svd(kernel)
+    rank = int((s > s[0] * 1e-9).sum()) if s[0] > 0 else 0
+    if not rank:
+        return np.zeros((h, w))
+
+    if rank * (kh + kw) <= FFT_PASSES * math.log(hist.size, 2):
+        return _convolveSeparable(hist, u[:, :rank] * s[:rank], vt[:rank], size)
+    return _convolveFFT(hist, kernel, size)
+
+def _convolveSeparable(hist, cols, rows, size):
+    w, h = size
+    kh, kw = cols.shape[0], rows.shape[1]
+    res = np.zeros((h, w))
+
+    for c in range(cols.shape[1]):
+        # out[y, x] = sum(hist[y + kh - 1 - j, x + kw - 1 - i] * dot[j, i])
+        tmp = np.zeros((hist.shape[0], w))
+        for i in range(kw):
+            tmp += rows[c, i] * hist[:, kw - 1 - i:kw - 1 - i + w]
+        for j in range(kh):
+            res += cols[j, c] * tmp[kh - 1 - j:kh - 1 - j + h]
+
+    return res
+
+def _convolveFFT(hist, kernel, size):
+    w, h = size
+    kh, kw = kernel.shape
+    shape = (_fastLength(hist.shape[0] + kh - 1), _fastLength(hist.shape[1] + kw - 1))
+
+    spectrum = np.fft.rfft2(hist, shape) * np.fft.rfft2(kernel, shape)
+    res = np.fft.irfft2(spectrum, shape)
+    return res[kh - 1:kh - 1 + h, kw - 1:kw - 1 + w]
+
+def _fastLength(n):
+    """Smallest number >= n that has no prime factors other than 2, 3 and 5"""
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            l = p35
+            while l < n:
+                l *= 2
+            best = min(best, l)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+def densityPoints(size, points, dot, quantize=True):
+    """
+    Builds (h, w) heat array from stream of normalized points using
+    histogram binning followed by a single kernel convolution. When quantize
+    is set weights are clipped to 8-bit range like PIL engine does
+    """
+    w, h = size
+    kh, kw = dot.shape
+    hist = np.zeros((h + kh - 1, w + kw - 1))
+
+    for batch in pointio.batches(points):
+        px, py = toPixels(batch, size)
+        ws = quantizeWeights(batch[:, 2]) / 255.0 if quantize else batch[:, 2]
+        histogram(hist, px, py, ws, dot)
+
+    return convolve(hist, dot, size)
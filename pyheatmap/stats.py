@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import resource
+import json
+import time
+import sys
+
+#====================================================
+
+def peakRss():
+    """Peak resident memory of the process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on OS X, kilobytes elsewhere
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+#====================================================
+
+class Stats(object):
+    enabled = True
+
+    def __init__(self):
+        """
+        Collects total wall time, number of calls and peak memory at the end
+        of named stages together with named counters. Stages may nest, e.g.
+        'read' runs inside of 'mask' when points are streamed
+        """
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self._start = time.time()
+
+    def stage(self, name):
+        """Returns context manager adding its wall time to the stage"""
+        return _Stage(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def iterate(self, name, batches, counter='points'):
+        """Wraps iterable of point arrays timing their reading as the stage and counting rows"""
+        batches = iter(batches)
+        while True:
+            with self.stage(name):
+                try:
+                    batch = next(batches)
+                except StopIteration:
+                    return
+            self.count(counter, len(batch))
+            yield batch
+
+    def merge(self, report):
+        """Adds stages and counters of report collected by another process,
+        stage times of parallel workers add up"""
+        for name, other in report.get('stages', {}).items():
+            stage = self._stage(name)
+            stage['seconds'] += other['seconds']
+            stage['calls'] += other['calls']
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'], other['peak_rss_mb'])
+        for name, n in report.get('counters', {}).items():
+            self.count(name, n)
+
+    def report(self):
+        return OrderedDict([
+            ('seconds', time.time() - self._start),
+            ('peak_rss_mb', peakRss()),
+            ('stages', self.stages),
+            ('counters', self.counters),
+        ])
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = OrderedDict([('seconds', 0.0), ('calls', 0), ('peak_rss_mb', 0.0)])
+        return stage
+
+    def _record(self, name, seconds):
+        stage = self._stage(name)
+        stage['seconds'] += seconds
+        stage['calls'] += 1
+        stage['peak_rss_mb'] = peakRss()
+
+class _Stage(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *exc):
+        self.stats._record(self.name, time.time() - self.start)
+
+#====================================================
+
+class NullStats(object):
+    """Collector used while stats are disabled"""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def count(self, name, n=1):
+        pass
+
+    def iterate(self, name, batches, counter='points'):
+        return batches
+
+    def merge(self, report):
+        pass
+
+    def report(self):
+        return OrderedDict()
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+# collection is off by default, module functions then call the null
+# collector, so instrumented code costs a function call per stage
+_NULL_STAGE = _NullStage()
+_NULL = NullStats()
+_active = _NULL
+
+#====================================================
+
+def enable():
+    """Starts collection into new Stats object and returns it"""
+    global _active
+    _active = Stats()
+    return _active
+
+def disable():
+    global _active
+    _active = _NULL
+
+def enabled():
+    return _active.enabled
+
+def stage(name):
+    return _active.stage(name)
+
+def count(name, n=1):
+    _active.count(name, n)
+
+def iterate(name, batches, counter='points'):
+    return _active.iterate(name, batches, counter)
+
+def merge(report):
+    _active.merge(report)
+
+def report():
+    return _active.report()
+
+def save(target):
+    """Writes report as JSON into file or to stderr if target is '-'"""
+    text = json.dumps(report(), indent=1, separators=(',', ': ')) + '\n'
+    if target == '-':
+        sys.stderr.write(text)
+    else:
+        with open(target, 'w') as f:
+            f.write(text)
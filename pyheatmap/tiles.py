@@ -0,0 +1,164 @@
+from PIL import Image
+from heatmap import Heatmap
+from partition.grid import Grid
+import numpy as np
+import os
+
+import kernels
+import pointio
+import splat
+
+#====================================================
+
+class TileRenderer(object):
+    CELL_ITEMS = 16
+
+    def __init__(self, points, palette, dotsize=35, opacity=0.9, tile_size=256, kernel='linear', falloff=1.0):
+        """
+        Renders slippy map tiles (z/x/y, y axis points down) of heat map
+        points     -> iterable of normalized (x,y[,w]) points, y axis points up
+        palette    -> palette image file name
+        dotsize    -> size of the heat dot in pixels on every zoom level
+        opacity    -> opacity of the heat layer
+        tile_size  -> size of a square tile in pixels
+        """
+        batches = list(pointio.batches(points))
+        self.points = np.concatenate(batches) if batches else np.zeros((0, 3))
+        self.tile_size = tile_size
+        self.dot = kernels.getKernel(kernel, dotsize, falloff)
+
+        self._heatmap = Heatmap()
+        self._heatmap.palette = self._heatmap._loadPalette(palette)
+        self._heatmap.opacity = opacity
+        self._heatmap.scale = None
+
+        # points further than one dot away from the map never touch any tile,
+        # grid cells hold about CELL_ITEMS points on average
+        margin = float(dotsize) / tile_size
+        cells = int(min(max(np.sqrt(len(self.points) / self.CELL_ITEMS), 1), 1024))
+        xs = self.points[:, 0].tolist()
+        ys = self.points[:, 1].tolist()
+        self._index = Grid((-margin, -margin, 1.0 + margin, 1.0 + margin),
+                           lambda i: (xs[i], ys[i]), cells_num=(cells, cells))
+        for i in range(len(xs)):
+            self._index.insert(i)
+
+    def tiles(self, zoom):
+        """
+        Returns sorted list of (x, y) tiles touched by dots at given zoom level
+        """
+        n = 1 << zoom
+        kh, kw = self.dot.shape
+        if not len(self.points):
+            return []
+
+        px, py = splat.toPixels(self.points, (n * self.tile_size, n * self.tile_size))
+
+        ranges = []
+        for p in (px, py):
+            first = (p - kw // 2) // self.tile_size
+            last = (p - kw // 2 + kw - 1) // self.tile_size
+            ranges.append((first, last))
+
+        (x0, x1), (y0, y1) = ranges
+        visible = (x1 >= 0) & (x0 < n) & (y1 >= 0) & (y0 < n)
+        x0, x1 = np.clip(x0[visible], 0, n - 1), np.clip(x1[visible], 0, n - 1)
+        y0, y1 = np.clip(y0[visible], 0, n - 1), np.clip(y1[visible], 0, n - 1)
+        if not len(x0):
+            return []
+
+        touched = set()
+        for dx in range(int((x1 - x0).max()) + 1):
+            for dy in range(int((y1 - y0).max()) + 1):
+                sel = (x0 + dx <= x1) & (y0 + dy <= y1)
+                touched.update(zip((x0[sel] + dx).tolist(), (y0[sel] + dy).tolist()))
+
+        return sorted(touched)
+
+    def tileMask(self, zoom, tx, ty):
+        """
+        Builds 8-bit heat mask of a single tile, returns None for empty tiles.
+        Tiles are crops of the whole map mask, so dots crossing tile borders
+        have no seams
+        """
+        ts = self.tile_size
+        world = (1 << zoom) * ts
+        kh, kw = self.dot.shape
+        ds_2 = kw // 2
+
+        # normalized area where points have dots touching the tile,
+        # one pixel wider to let integer test below make the final decision
+        x0 = float(tx * ts + ds_2 - kw) / world
+        x1 = float((tx + 1) * ts + ds_2 + 1) / world
+        y0 = 1.0 - float((ty + 1) * ts + ds_2 + 1) / world
+        y1 = 1.0 - float(ty * ts + ds_2 - kh) / world
+
+        indices = np.fromiter(self._index.query_rect((x0, y0, x1, y1)), np.int64)
+        if not len(indices):
+            return None
+
+        batch = self.points[indices]
+        px, py = splat.toPixels(batch, (world, world))
+
+        acc = np.zeros((ts, ts), np.uint32)
+        splat.splat(acc, px - tx * ts, py - ty * ts, batch[:, 2], self.dot)
+        if not acc.any():
+            return None
+
+        return np.minimum(acc, 255).astype(np.uint8)
+
+    def renderTile(self, zoom, tx, ty):
+        """Renders RGBA tile image or returns None if no heat falls into it"""
+        mask = self.tileMask(zoom, tx, ty)
+        if mask is None:
+            return None
+        return self._heatmap._colorize(mask)
+
+    def renderPyramid(self, outdir, zooms):
+        """
+        Writes outdir/z/x/y.png tiles for all given zoom levels,
+        returns number of written tiles
+        """
+        written = 0
+        for z in zooms:
+            for tx, ty in self.tiles(z):
+                img = self.renderTile(z, tx, ty)
+                if img is None:
+                    continue
+
+                path = os.path.join(outdir, str(z), str(tx))
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                img.save(os.path.join(path, '%d.png' % ty), 'PNG')
+                written += 1
+
+        return written
+
+#====================================================
+
+if __name__ == '__main__':
+    import sys, argparse
+
+    parser = argparse.ArgumentParser(description='Renders z/x/y PNG tile pyramid of heat map from CSV files or stdin')
+    parser.add_argument('--palette', dest="palette", help="palette file for color mapping", default='resources/palette.png')
+    parser.add_argument('--zoom', dest="zoom", help="zoom level or range of levels (e.g. 0-5)", default='0-5')
+    parser.add_argument('--tile', dest="tile", help="tile size in pixels", default=256, type=int)
+    parser.add_argument('--dotsize', dest="dotsize", help="size of the heat dot in pixels", default=35, type=int)
+    parser.add_argument('--kernel', dest="kernel", help="shape of the heat dot", choices=kernels.SHAPES, default='linear')
+    parser.add_argument('--falloff', dest="falloff", help="relative radius at which dot strength reaches zero", default=1.0, type=float)
+    parser.add_argument('--opacity', dest="opacity", help="opacity of the heat layer", default=0.9, type=float)
+    parser.add_argument('--out', dest="output", help="output directory", default="tiles")
+    parser.add_argument('file', nargs='*', help="the source CSV or binary file")
+
+    args = parser.parse_args()
+    zooms = map(int, args.zoom.split('-'))
+    zooms = range(zooms[0], zooms[-1] + 1)
+
+    points = pointio.read_points(args.file)
+
+    try:
+        renderer = TileRenderer(points, args.palette, dotsize=args.dotsize, opacity=args.opacity,
+                                tile_size=args.tile, kernel=args.kernel, falloff=args.falloff)
+        renderer.renderPyramid(args.output, zooms)
+    except KeyboardInterrupt:
+        pass
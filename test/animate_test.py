@@ -0,0 +1,86 @@
+from pyheatmap.animate import Animator
+from pyheatmap.heatmap import Heatmap, LiveHeatmap
+from PIL import Image
+import numpy as np
+import random
+import tempfile
+import unittest
+import mock
+import os
+
+PALETTE = 'resources/palette.png'
+
+def randomPoints(n, seed=0):
+    rnd = random.Random(seed)
+    return [(rnd.random(), rnd.random(), rnd.uniform(0.2, 1.0), rnd.uniform(0.0, 10.0)) for _ in range(n)]
+
+#====================================================
+
+class AnimatorTest(unittest.TestCase):
+    def create(self, points):
+        return Heatmap().create([p[:3] for p in points], PALETTE, size=(60, 40), dotsize=9, engine='numpy')
+
+    def testWindowFrames(self):
+        points = randomPoints(300)
+        animator = Animator(points, PALETTE, size=(60, 40), dotsize=9)
+
+        frames = [(t, img.tobytes()) for t, img in animator.frames(2.0, window=3.0, start=0.0)]
+        self.assertEqual([t for t, _ in frames], [2.0, 4.0, 6.0, 8.0, 10.0])
+        for t, img in frames:
+            expected = self.create([p for p in points if t - 3.0 <= p[3] < t])
+            self.assertEqual(img, expected.tobytes())
+
+    def testCumulativeFrames(self):
+        points = randomPoints(300, seed=1)
+        animator = Animator(np.array(points), PALETTE, size=(60, 40), dotsize=9)
+
+        t, img = list(animator.frames(4.0, mode='cumulative', start=0.0, end=10.0))[-1]
+        self.assertEqual(t, 12.0)
+        self.assertEqual(img.tobytes(), self.create(points).tobytes())
+
+    def testDecayFrames(self):
+        points = randomPoints(300, seed=2)
+        animator = Animator(points, PALETTE, size=(60, 40), dotsize=9)
+
+        t, img = list(animator.frames(1.0, mode='decay', half_life=2.0, start=0.0))[-1]
+        fresh = self.create([p for p in points if t - 1.0 <= p[3] < t])
+        self.assertEqual(img.size, fresh.size)
+        self.assertNotEqual(img.tobytes(), fresh.tobytes())
+
+        # points of the first instant fade by half every half life
+        peaks = []
+        render = LiveHeatmap.render
+        def recordPeak(live):
+            peaks.append(live.acc.max())
+            return render(live)
+
+        start = [p[:3] + (0.0,) for p in points[:50]]
+        with mock.patch.object(LiveHeatmap, 'render', recordPeak):
+            frames = list(Animator(start, PALETTE, size=(60, 40), dotsize=9).frames(1.0, mode='decay', half_life=1.0, start=0.0, end=2.0))
+        self.assertEqual([t for t, _ in frames], [1.0, 2.0, 3.0])
+        self.assertEqual(len(peaks), 3)
+
+        live = LiveHeatmap(PALETTE, size=(60, 40), dotsize=9, dtype=np.float64)
+        live.add_points([np.array(start)[:, :3]])
+        for k, peak in enumerate(peaks):
+            self.assertAlmostEqual(peak, live.acc.max() * 0.5 ** (k + 1))
+
+        self.assertRaises(Exception, lambda: list(animator.frames(1.0, mode='bounce')))
+
+    def testSave(self):
+        animator = Animator(randomPoints(100, seed=3), PALETTE, size=(30, 20), dotsize=5)
+        tmp = tempfile.mkdtemp()
+        try:
+            self.assertEqual(animator.save(os.path.join(tmp, 'f', '%03d.png'), 2.5, start=0.0, end=9.0), 4)
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp, 'f'))), ['000.png', '001.png', '002.png', '003.png'])
+
+            gif = os.path.join(tmp, 'anim.gif')
+            self.assertEqual(animator.save(gif, 2.5, start=0.0, end=9.0), 4)
+            self.assertEqual(Image.open(gif).n_frames, 4)
+        finally:
+            for root, dirs, files in os.walk(tmp, topdown=False):
+                for f in files:
+                    os.remove(os.path.join(root, f))
+                for d in dirs:
+                    os.rmdir(os.path.join(root, d))
+            os.rmdir(tmp)
@@ -0,0 +1,63 @@
+from pyheatmap.partition.aqtree import *
+from pyheatmap.partition.qtree import QuadTree
+from mock import patch, call
+import test.qtree_test as qtree_test
+
+import random
+import unittest
+
+#====================================================
+
+class ArrayQuadTreeTest(qtree_test.QuedTreeTest):
+    """Runs QuadTree test suite against ArrayQuadTree"""
+    
+    def setUp(self):
+        patcher = patch('test.qtree_test.QuadTree', ArrayQuadTree)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @patch('pyheatmap.partition.qtree.QuadTreeVisitor')
+    def testVisitor(self, MockVisitor):
+        # branch with four leaves is built by splitting instead of QuadBranch internals
+        qt = ArrayQuadTree((0,0,1,1), max_items=1)
+        for p in [(0.2, 0.2), (0.2, 0.7), (0.7, 0.7), (0.7, 0.2)]:
+            qt.insert(p)
+        children = qt.root.children
+        self.assertEqual(len(children), 4)
+        
+        visitor = MockVisitor()
+        visitor.enterBranch.return_value = True
+        qt.accept(visitor)
+        
+        self.assertListEqual([call.enterBranch(qt.root)] + [call.visitLeaf(c) for c in children] + \
+                             [call.leaveBranch(qt.root)], visitor.mock_calls)
+    
+    def testSameStructureAsQuadTree(self):
+        rnd = random.Random(5)
+        points = [(rnd.random(), rnd.random()) for _ in range(400)] + [(0.5, 0.5), (1.0, 0.0)]
+        
+        for params in [dict(max_items=4), dict(max_items=3, max_depth=4, min_items=3), dict(max_items=1, min_size=0.05, min_items=1)]:
+            qt = QuadTree((0,0,1,1), **params)
+            aqt = ArrayQuadTree((0,0,1,1), **params)
+            for p in points:
+                self.assertEqual(aqt.insert(p), qt.insert(p))
+            self.assertEqual(str(aqt), str(qt))
+            
+            for p in points[::3] + [(0.123, 0.456)]:
+                self.assertEqual(aqt.remove(p), qt.remove(p))
+            self.assertEqual(str(aqt), str(qt))
+            self.assertEqual(aqt.count, qt.count)
+            
+            bulk = ArrayQuadTree.from_items(points, (0,0,1,1), **params)
+            self.assertEqual(str(bulk), str(QuadTree.from_items(points, (0,0,1,1), **params)))
+    
+    def testFreedNodesAreReused(self):
+        qt = ArrayQuadTree((0,0,1,1), max_items=1, min_items=1)
+        qt.insert((0.1, 0.1))
+        qt.insert((0.9, 0.9))
+        self.assertEqual(len(qt._child), 5)
+        
+        qt.remove((0.9, 0.9))
+        self.assertEqual(qt.depth, 1)
+        qt.insert((0.9, 0.9))
+        self.assertEqual(len(qt._child), 5)
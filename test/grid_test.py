@@ -27,4 +27,38 @@ class GridTest(unittest.TestCase):
         
         where = grid.remove((0.1,0.3))
         self.assertEqual(where, (0,1))
-        self.assertEqual(grid.count, 0)
\ No newline at end of file
+        self.assertEqual(grid.count, 0)
+    
+    def testQueryRect(self):
+        grid = Grid((0,0,1,1), cells_num=(4,4))
+        for p in [(0.1,0.1), (0.3,0.3), (0.35,0.6), (0.9,0.9), (1.0,1.0)]:
+            grid.insert(p)
+        
+        self.assertListEqual(sorted(grid.query_rect((0.2,0.2,0.4,0.7))), [(0.3,0.3), (0.35,0.6)])
+        self.assertListEqual(sorted(grid.query_rect((0.9,0.9,2,2))), [(0.9,0.9)])
+        self.assertListEqual(list(grid.query_rect((-2,-2,-1,-1))), [])
+    
+    def testSparse(self):
+        grid = Grid((0,0,1,1), cell_size=0.0001, sparse=True)
+        self.assertEqual(grid.dimensions, (10000,10000))
+        
+        for p in [(0.9,0.9), (0.1,0.3), (0.10001,0.30001), (0.5,0.5)]:
+            grid.insert(p)
+        
+        self.assertEqual(grid.count, 4)
+        self.assertEqual(len(grid._cells), 3)
+        self.assertListEqual([c.index for c in grid.cells], [(1000,3000), (5000,5000), (9000,9000)])
+        self.assertListEqual(list(grid.items), [(0.1,0.3), (0.10001,0.30001), (0.5,0.5), (0.9,0.9)])
+        self.assertEqual(grid[0,0].count, 0)
+        self.assertEqual(len(grid._cells), 3)
+        self.assertListEqual(list(grid.query_rect((0.05,0.05,0.6,0.6))), [(0.1,0.3), (0.10001,0.30001), (0.5,0.5)])
+        
+        self.assertEqual(grid.remove((0.5,0.5)), (5000,5000))
+        self.assertEqual(len(grid._cells), 2)
+        grid.insert((0.2,0.1))
+        self.assertListEqual([c.index for c in grid.cells], [(2000,1000), (1000,3000), (9000,9000)])
+        self.assertEqual(grid.count, 4)
+        
+        grid.clear()
+        self.assertEqual(grid.count, 0)
+        self.assertEqual(grid.dimensions, (10000,10000))
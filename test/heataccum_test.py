@@ -0,0 +1,301 @@
+from pyheatmap.heataccum import *
+from pyheatmap import pointio
+import numpy as np
+import random
+import unittest
+import tempfile
+import mock
+import time
+import os
+
+def randomPoints(n, seed=0):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(-0.05, 1.05), rnd.uniform(-0.05, 1.05), rnd.uniform(0.1, 2.0)) for _ in range(n)]
+
+#====================================================
+
+class ArrayHeatGridTest(unittest.TestCase):
+    def assertItemsAlmostEqual(self, a, b):
+        self.assertEqual(len(a), len(b))
+        for p, q in zip(a, b):
+            for u, v in zip(p, q):
+                self.assertAlmostEqual(u, v)
+    
+    def testInsertMatchesHeatGrid(self):
+        points = randomPoints(500)
+        grid = HeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(7,5))
+        agrid = ArrayHeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(7,5))
+        
+        for p in points:
+            cell = grid.getCell(p[:2])
+            self.assertEqual(agrid.insert(p), cell.index if cell else None)
+            grid.insert(p)
+        
+        self.assertEqual(agrid.count, grid.count)
+        self.assertItemsAlmostEqual(list(agrid.items), list(grid.items))
+    
+    def testGridInterface(self):
+        points = randomPoints(500, seed=8)
+        grid = HeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(7,5))
+        for p in points:
+            grid.insert(p)
+        
+        for sparse in (False, True):
+            agrid = ArrayHeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(7,5), sparse=sparse)
+            for p in points:
+                agrid.insert(p)
+            
+            cells = [c for c in grid.cells if c.count or not sparse]
+            self.assertEqual([c.index for c in agrid.cells], [c.index for c in cells])
+            self.assertItemsAlmostEqual([i for c in agrid.cells for i in c.items], list(grid.items))
+            self.assertItemsAlmostEqual(agrid[3, 2].items, grid[3, 2].items)
+            with mock.patch.object(agrid, 'cellSums', side_effect=AssertionError('lookup scans all cells')):
+                for cy in range(5):
+                    for cx in range(7):
+                        self.assertItemsAlmostEqual(agrid[cx, cy].items, grid[cx, cy].items)
+            self.assertItemsAlmostEqual(agrid.getCell((0.5, 0.5)).items, grid.getCell((0.5, 0.5)).items)
+            self.assertEqual(agrid.getCell((1.5, 0.5)), None)
+            self.assertItemsAlmostEqual(list(agrid.query_rect((0.2, 0.1, 0.7, 0.6))), list(grid.query_rect((0.2, 0.1, 0.7, 0.6))))
+    
+    def testInsertMany(self):
+        points = randomPoints(500, seed=1)
+        agrid = ArrayHeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cell_size=0.1)
+        inserted = sum(1 for p in points if agrid.insert(p))
+        
+        batch = ArrayHeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cell_size=0.1)
+        arr = np.array(points)
+        accepted = batch.insert_many(arr[:250,0], arr[:250,1], arr[:250,2])
+        accepted += batch.insert_many(arr[250:,0], arr[250:,1], arr[250:,2])
+        
+        self.assertEqual(accepted, inserted)
+        self.assertItemsAlmostEqual(list(batch.items), list(agrid.items))
+    
+    def testClear(self):
+        agrid = ArrayHeatGrid((0,0,1,1), cells_num=(2,2))
+        agrid.insert((0.5, 0.5, 1.0))
+        agrid.clear()
+        self.assertEqual(agrid.count, 0)
+        self.assertEqual(agrid.dimensions, (2,2))
+    
+    def testSparseMatchesDense(self):
+        points = np.array(randomPoints(2000, seed=2))
+        dense = ArrayHeatGrid((0,0,1,1), cells_num=(300,200))
+        sparse = ArrayHeatGrid((0,0,1,1), cells_num=(300,200), sparse=True)
+        sparse.SPARSE_STAGE = 100
+        
+        for b in range(0, len(points), 150):
+            chunk = points[b:b+150]
+            dense.insert_many(chunk[:,0], chunk[:,1], chunk[:,2])
+            sparse.insert_many(chunk[:,0], chunk[:,1], chunk[:,2])
+        sparse.insert((0.5, 0.5, 1.0))
+        dense.insert((0.5, 0.5, 1.0))
+        
+        self.assertEqual(sparse.count, dense.count)
+        self.assertItemsAlmostEqual(list(sparse.items), list(dense.items))
+        self.assertLessEqual(len(sparse.cellSums()[0]), len(points) + 1)
+        
+        sparse.clear()
+        self.assertEqual(sparse.count, 0)
+
+    def testShardedFiles(self):
+        points = np.array(randomPoints(3000, seed=3))
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pointio.BinaryWriter(f).write(points)
+            
+            whole = accumulate([points], cells_num=(40,30)).normalizedPoints()
+            with mock.patch.object(pointio, 'SHARD_SIZE', 4000):
+                self.assertGreater(len(list(pointio.shards([fname]))), 5)
+                single = accumulateFiles([fname], cells_num=(40,30)).normalizedPoints()
+                multi = accumulateFiles([fname], cells_num=(40,30), workers=3).normalizedPoints()
+            
+            self.assertEqual(single.tolist(), multi.tolist())
+            self.assertTrue(np.allclose(single, whole, rtol=1e-9))
+        finally:
+            os.remove(fname)
+
+    def testShardedFileWithBlankLine(self):
+        points = np.array(randomPoints(3000, seed=7))
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with pointio.PointWriter(f) as out:
+                    out.write(points[:1000])
+                f.write('\n')
+                with pointio.PointWriter(f) as out:
+                    out.write(points[1000:])
+            
+            with open(fname, 'rb') as f:
+                streamed = accumulate(pointio.read_points(None, f), cells_num=(40,30)).cellSums()
+            with mock.patch.object(pointio, 'SHARD_SIZE', 4096):
+                self.assertGreater(len(list(pointio.shards([fname]))), 5)
+                sharded = accumulateFiles([fname], cells_num=(40,30)).cellSums()
+            
+            self.assertEqual(sharded[0].tolist(), streamed[0].tolist())
+            self.assertTrue(np.allclose(sharded[1], streamed[1], rtol=1e-9))
+            first = accumulate([points[:1000]], cells_num=(40,30)).cellSums()
+            self.assertTrue(np.allclose(sharded[1][:,2].sum(), first[1][:,2].sum()))
+        finally:
+            os.remove(fname)
+
+    def testStates(self):
+        points = np.array(randomPoints(1000, seed=4))
+        whole = accumulate([points], cells_num=(30,20))
+        first = accumulate([points[:400]], cells_num=(30,20))
+        second = accumulate([points[400:]], cells_num=(30,20), sparse=True)
+        
+        tmp = tempfile.mkdtemp()
+        try:
+            f1, f2 = os.path.join(tmp, 'a.npz'), os.path.join(tmp, 'b.npz')
+            first.saveState(f1)
+            second.saveState(f2)
+            
+            loaded = ArrayHeatGrid.loadState(f1)
+            self.assertEqual(loaded.dimensions, (30,20))
+            self.assertEqual(loaded.cellSums()[1].tolist(), first.cellSums()[1].tolist())
+            
+            merged = mergeStates([f1, f2])
+            self.assertTrue(np.allclose(merged.normalizedPoints(), whole.normalizedPoints()))
+            
+            other = accumulate([points], cells_num=(30,21))
+            self.assertRaises(Exception, other.mergeState, f1)
+        finally:
+            for f in os.listdir(tmp):
+                os.remove(os.path.join(tmp, f))
+            os.rmdir(tmp)
+    
+    def testPyramid(self):
+        points = np.clip(randomPoints(1000, seed=5), 0.0, 0.999)
+        grid = accumulate([points], cells_num=(40,24))
+        levels = [(40,24), (20,12), (10,6), (5,3)]
+        self.assertEqual([dims for dims, _, _ in buildPyramid(grid, 4)], levels)
+        
+        tmp = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp, 'pyramid.npz')
+            savePyramid(fname, grid, 4)
+            for level, dims in enumerate(levels):
+                direct = accumulate([points], cells_num=dims)
+                loaded = loadPyramidLevel(fname, level)
+                self.assertEqual(loaded.dimensions, dims)
+                self.assertEqual(loaded.cellSums()[0].tolist(), direct.cellSums()[0].tolist())
+                self.assertTrue(np.allclose(loaded.normalizedPoints(), direct.normalizedPoints()))
+            
+            self.assertRaises(Exception, loadPyramidLevel, fname, 4)
+            self.assertRaises(Exception, buildPyramid, grid, 5)
+        finally:
+            for f in os.listdir(tmp):
+                os.remove(os.path.join(tmp, f))
+            os.rmdir(tmp)
+    
+    def testAdaptivePoints(self):
+        points = np.array(randomPoints(2000, seed=6))
+        points[:1000, :2] = points[:1000, :2] * 0.1 + 0.3
+        grid = accumulate([points], cells_num=(64,64))
+        keys, sums = grid.cellSums()
+        
+        for n in (1, 7, 50, 300):
+            heat = adaptivePoints(grid, n)
+            self.assertTrue(0 < len(heat) <= n)
+            self.assertEqual(heat[:,2].max(), 1.0)
+        
+        top = adaptivePoints(grid, 1)
+        self.assertTrue(np.allclose(top[0,:2], sums[:,:2].sum(0) / sums[:,2].sum()))
+        
+        every = adaptivePoints(grid, len(keys))
+        self.assertTrue(np.allclose(np.sort(every, 0), np.sort(grid.normalizedPoints(), 0)))
+        
+        coarse = adaptivePoints(grid, len(keys), min_items=10)
+        self.assertTrue(len(coarse) < len(keys))
+        self.assertRaises(Exception, adaptivePoints, grid, 0)
+
+#====================================================
+
+class TimedHeatGridTest(unittest.TestCase):
+    def randomStream(self, n, seed=0):
+        rnd = random.Random(seed)
+        return np.array([(rnd.random(), rnd.random(), rnd.uniform(0.5, 2.0), i * 0.1) for i in range(n)])
+    
+    def testDecayMatchesDirectSum(self):
+        points = self.randomStream(1000)
+        grid = DecayHeatGrid((0,0,1,1), cells_num=(5,4), half_life=7.0)
+        for b in range(0, len(points), 90):
+            chunk = points[b:b+90]
+            grid.insert_many(chunk[:,0], chunk[:,1], chunk[:,2], chunk[:,3])
+        
+        at = 150.0
+        ws = points[:,2] * 0.5 ** ((at - points[:,3]) / 7.0)
+        expected = ArrayHeatGrid((0,0,1,1), cells_num=(5,4))
+        expected.insert_many(points[:,0], points[:,1], ws)
+        
+        keys, sums = grid.cellSums(at)
+        ekeys, esums = expected.cellSums()
+        self.assertEqual(keys.tolist(), ekeys.tolist())
+        self.assertTrue(np.allclose(sums, esums))
+        self.assertEqual(grid.now, at)
+    
+    def testWindowKeepsRecentPoints(self):
+        points = self.randomStream(1000, seed=1)
+        grid = WindowHeatGrid((0,0,1,1), cells_num=(5,4), window=20.0, buckets=10)
+        ring = grid._ring
+        for b in range(0, len(points), 70):
+            chunk = points[b:b+70]
+            grid.insert_many(chunk[:,0], chunk[:,1], chunk[:,2], chunk[:,3])
+        
+        # window covers whole buckets ending with the bucket of the latest point
+        recent = points[points[:,3] > 79.95]
+        expected = ArrayHeatGrid((0,0,1,1), cells_num=(5,4))
+        expected.insert_many(recent[:,0], recent[:,1], recent[:,2])
+        
+        self.assertTrue(np.allclose(grid.cellSums()[1], expected.cellSums()[1]))
+        self.assertIs(grid._ring, ring)
+        self.assertEqual(grid.count, expected.count)
+        self.assertEqual(grid.cellSums(200.0)[1].tolist(), [])
+        self.assertEqual(grid.insert((0.5, 0.5, 1.0, 10.0)), None)
+    
+    def testSnapshots(self):
+        points = self.randomStream(1000, seed=2)
+        grid = WindowHeatGrid((0,0,1,1), cells_num=(5,4), window=10.0, buckets=5)
+        batches = [points[b:b+300] for b in range(0, len(points), 300)]
+        
+        snapshots = list(streamSnapshots(grid, batches, every=25.0))
+        self.assertEqual([t for t, _ in snapshots], [25.0, 50.0, 75.0, 99.9])
+        for _, s in snapshots:
+            self.assertEqual(s[:,2].max(), 1.0)
+        
+        other = WindowHeatGrid((0,0,1,1), cells_num=(5,4), window=10.0, buckets=5)
+        other.insert_many(points[:500,0], points[:500,1], points[:500,2], points[:500,3])
+        self.assertEqual(snapshots[1][1].tolist(), other.normalizedPoints(50.0).tolist())
+    
+    def testMissingTimestamps(self):
+        grid = DecayHeatGrid((0,0,1,1), cells_num=(2,2), half_life=1000.0)
+        self.assertEqual(grid.insert((0.2, 0.2)), (0, 0))
+        grid.insert_many(np.array([0.7]), np.array([0.7]), np.array([1.0]), np.array([np.nan]))
+        self.assertEqual(grid.count, 2)
+        self.assertAlmostEqual(grid.now, time.time(), delta=60)
+        self.assertRaises(Exception, grid.addCellSums, np.array([0]), np.zeros((1, 3)))
+    
+    def testCellLookup(self):
+        points = self.randomStream(300, seed=4)
+        for grid in (DecayHeatGrid((0,0,1,1), cells_num=(5,4), half_life=5.0), WindowHeatGrid((0,0,1,1), cells_num=(5,4), window=10.0, buckets=5)):
+            self.assertEqual(grid[1, 1].items, [])
+            grid.insert_many(points[:,0], points[:,1], points[:,2], points[:,3])
+            
+            keys, sums = grid.cellSums()
+            looked = [(k, grid[k % 5, k // 5].items) for k in range(20)]
+            self.assertEqual([k for k, items in looked if items], keys.tolist())
+            for (k, items), i in zip([l for l in looked if l[1]], grid._merged(sums)):
+                self.assertTrue(np.allclose(items[0], i))
+    
+    def testSnapshotTime(self):
+        for grid in (DecayHeatGrid((0,0,1,1), cells_num=(2,2), half_life=10.0), WindowHeatGrid((0,0,1,1), cells_num=(2,2), window=10.0)):
+            grid.insert_many(np.array([0.2, 0.7]), np.array([0.2, 0.7]), np.array([1.0, 1.0]), np.array([5.0, 3.0]))
+            self.assertEqual(grid.now, 5.0)
+            
+            # late points do not move stream time back, snapshots before it are refused
+            grid.insert((0.7, 0.2, 1.0, 1.0))
+            self.assertEqual(grid.now, 5.0)
+            self.assertRaises(Exception, grid.cellSums, 4.0)
+            self.assertEqual(len(grid.cellSums(5.0)[0]), 3)
+            self.assertEqual(grid.now, 5.0)
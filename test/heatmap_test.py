@@ -0,0 +1,136 @@
+from pyheatmap.heatmap import Heatmap, LiveHeatmap
+from PIL import Image
+import random
+import unittest
+
+PALETTE = 'resources/palette.png'
+
+def randomPoints(n, seed=0):
+    rnd = random.Random(seed)
+    points = []
+    for _ in range(n):
+        x, y = rnd.uniform(-0.1, 1.1), rnd.uniform(-0.1, 1.1)
+        if rnd.random() < 0.5:
+            points.append((x, y))
+        else:
+            points.append((x, y, rnd.uniform(0.0, 1.2)))
+    return points
+
+#====================================================
+
+class HeatmapTest(unittest.TestCase):
+    def buildMask(self, engine, points, size, dotsize):
+        hm = Heatmap()
+        hm.points = points
+        hm.size = size
+        hm.dotsize = dotsize
+        hm.scale = None
+        dot = hm._buildDot(dotsize)
+        if engine == 'pil':
+            return hm._buildMask(dot)
+        if engine == 'numpy':
+            return hm._buildMaskArray(dot)
+        return hm._buildMaskDensity(dot)
+
+    def testNumpyEngineMatchesPil(self):
+        points = randomPoints(300)
+        for dotsize in (7, 20):
+            pil = self.buildMask('pil', points, (64, 48), dotsize)
+            arr = self.buildMask('numpy', points, (64, 48), dotsize)
+            self.assertEqual(list(pil.getdata()), list(arr.getdata()))
+
+    def testHistEngineMatchesPilForUnitWeights(self):
+        points = [p[:2] for p in randomPoints(300)]
+        # small dot is convolved as separable, big one through FFT
+        for dotsize in (3, 20):
+            pil = self.buildMask('pil', points, (64, 48), dotsize)
+            hist = self.buildMask('hist', points, (64, 48), dotsize)
+            self.assertEqual(list(pil.getdata()), list(hist.getdata()))
+
+    def testCreateWithEngine(self):
+        points = [p[:2] for p in randomPoints(50, seed=1)]
+        imgs = [Heatmap().create(points, PALETTE, size=(40, 30), dotsize=10, engine=e)
+                for e in Heatmap.ENGINES]
+        for img in imgs[1:]:
+            self.assertEqual(imgs[0].tobytes(), img.tobytes())
+
+    def testUnknownEngine(self):
+        with self.assertRaises(Exception):
+            Heatmap().create([], PALETTE, size=(10, 10), engine='gpu')
+
+    def testLookupColorizeMatchesPixelLoop(self):
+        hm = Heatmap()
+        hm.size = (256, 2)
+        hm.scale = None
+        hm.palette = hm._loadPalette(PALETTE)
+        mask = Image.new('L', hm.size)
+        mask.putdata(list(range(256)) * 2)
+        
+        for opacity in (0.0, 0.37, 0.9, 1.5):
+            hm.opacity = opacity
+            res = hm._colorize(mask)
+            
+            expected = []
+            for strength in mask.getdata():
+                r, g, b, a = hm.palette[strength]
+                a = min(int(a * opacity), 255) if strength > 0 else 0
+                expected.append((r, g, b, a))
+            self.assertEqual(list(res.getdata()), expected)
+
+    def testHighDynamicRangeDoesNotClip(self):
+        hm = Heatmap()
+        hm.size = (20, 20)
+        hm.dotsize = 10
+        hm.scale = 'linear'
+        hm.points = [(0.5, 0.5, 5.0)] * 10 + [(0.2, 0.2, 5.0)]
+        acc = hm._buildMaskArray(hm._buildDot(10))
+        
+        self.assertAlmostEqual(acc.max(), 255 * 50.0)
+        self.assertAlmostEqual(acc[16, 4], 255 * 5.0)
+        
+        for scale in Heatmap.SCALES:
+            hm.scale = scale
+            mask = hm._normalizeMask(acc)
+            self.assertEqual(mask.max(), 255)
+            self.assertEqual(mask[0, 0], 0)
+            self.assertTrue(0 < mask[16, 4] < 255)
+
+    def testScaleRequiresNumpyEngine(self):
+        with self.assertRaises(Exception):
+            Heatmap().create([], PALETTE, size=(10, 10), scale='log')
+        img = Heatmap().create(randomPoints(20), PALETTE, size=(10, 10), engine='numpy', scale='log')
+        self.assertEqual(img.size, (10, 10))
+
+#====================================================
+
+class LiveHeatmapTest(unittest.TestCase):
+    def testUpdatesMatchCreate(self):
+        points = randomPoints(400, seed=2)
+        bg = Image.new('RGB', (100, 70), (10, 200, 30))
+        live = LiveHeatmap(PALETTE, dotsize=15, opacity=0.8, background=bg)
+        
+        live.add_points(points[:300])
+        live.render()
+        live.remove_points(points[:100])
+        live.add_points(points[300:])
+        img = live.render()
+        
+        expected = Heatmap().create(points[100:], PALETTE, dotsize=15, opacity=0.8, background=bg, engine='numpy')
+        self.assertEqual(img.tobytes(), expected.tobytes())
+        self.assertEqual(live.acc.min(), 0)
+    
+    def testDirtyRects(self):
+        live = LiveHeatmap(PALETTE, size=(100, 70), dotsize=10)
+        self.assertEqual(live.dirtyRects, [])
+        
+        live.add_points([(0.5, 0.5), (0.55, 0.5)])
+        self.assertEqual(live.dirtyRects, [(32, 0, 64, 32), (32, 32, 64, 64)])
+        
+        before = live.render().copy()
+        self.assertEqual(live.dirtyRects, [])
+        live.add_points([(0.99, 0.01)])
+        self.assertEqual(live.dirtyRects, [(64, 64, 100, 70)])
+        
+        img = live.render()
+        self.assertEqual(img.crop((0, 0, 100, 64)).tobytes(), before.crop((0, 0, 100, 64)).tobytes())
+        self.assertNotEqual(img.tobytes(), before.tobytes())
@@ -0,0 +1,60 @@
+from pyheatmap.kernels import *
+import math
+import unittest
+
+def loopDot(size):
+    """Per-pixel dot builder the linear kernel has to reproduce"""
+    center = (size / 2.0)
+    r_rec = 1.0 / math.sqrt( center * center )
+    dot = [[0] * size for _ in range(size)]
+    for x in range(size):
+        for y in range(size):
+            dx = x - center
+            dy = y - center
+            d = math.sqrt( dx * dx + dy * dy )
+            dot[y][x] = min(max(255 - int( 255 * d * r_rec ), 0), 255)
+    return dot
+
+#====================================================
+
+class KernelsTest(unittest.TestCase):
+    def testLinearMatchesLoop(self):
+        for size in (1, 2, 7, 35, 150):
+            self.assertEqual(buildKernel('linear', size).tolist(), loopDot(size))
+
+    def testShapes(self):
+        for shape in SHAPES:
+            k = buildKernel(shape, 40)
+            self.assertEqual(k.shape, (40, 40))
+            self.assertEqual(k[20, 20], 255)
+            self.assertEqual(k[0, 0], 0)
+            self.assertEqual(k[20, 0], 0)
+            self.assertTrue((k[20, :21] == sorted(k[20, :21])).all())
+
+    def testFalloff(self):
+        k = buildKernel('quartic', 40, falloff=0.5)
+        self.assertEqual(k[20, 5], 0)
+        self.assertGreater(k[20, 12], 0)
+
+    def testInvalid(self):
+        self.assertRaises(Exception, buildKernel, 'box', 10)
+        self.assertRaises(Exception, buildKernel, 'linear', 0)
+
+    def testCacheReusesKernels(self):
+        cache = KernelCache()
+        k = cache.get('gaussian', 30)
+        self.assertIs(cache.get('gaussian', 30, 1.0), k)
+        self.assertFalse(k.flags.writeable)
+        self.assertEqual(len(cache), 1)
+
+    def testCacheEvictsLeastRecentlyUsed(self):
+        cache = KernelCache(max_bytes=250)
+        cache.get('linear', 10)
+        cache.get('quartic', 10)
+        cache.get('linear', 10)
+        cache.get('gaussian', 10)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.nbytes, 200)
+        self.assertIn(('linear', 10, 1.0), cache)
+        self.assertNotIn(('quartic', 10, 1.0), cache)
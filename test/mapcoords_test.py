@@ -1,4 +1,5 @@
-from pyheatmap.mapcoords import normalize_coords
+from pyheatmap.mapcoords import normalize_coords, normalize_batch, count_outside, find_area, clip_area
+import numpy as np
 import unittest
 
 class CoordTransformerTest(unittest.TestCase):
@@ -6,3 +7,27 @@ class CoordTransformerTest(unittest.TestCase):
         points = [[0.0,0.0], [5.0,5.0], [10.0,10.0]]
         norm = list(normalize_coords(points, (0.0, 0.0, 10.0, 10.0)))
         self.assertListEqual(norm, [(0.0,0.0),(0.5,0.5),(1.0,1.0)])
+    
+    def testNormalizeBatch(self):
+        points = [[0.0,0.0,1.0], [5.0,5.0,1.0], [10.0,12.0,1.0], [-1.0,3.0,1.0]]
+        batch = np.array(points)
+        self.assertEqual(count_outside(batch, (0.0, 0.0, 10.0, 10.0)), 2)
+        
+        norm = normalize_batch(batch, (0.0, 0.0, 10.0, 10.0))
+        self.assertListEqual(norm.tolist(), list(map(list, normalize_coords(points, (0.0, 0.0, 10.0, 10.0)))))
+    
+    def testFindArea(self):
+        rnd = np.random.RandomState(0)
+        batches = [rnd.uniform(-5.0, 5.0, (1000, 3)) for _ in range(3)]
+        batches[1][7,:2] = (-100.0, 400.0)
+        
+        points = np.concatenate(batches)
+        area = find_area(batches)
+        self.assertEqual(area, (-100.0, points[:,1].min(), points[:,0].max(), 400.0))
+        self.assertEqual(find_area([np.array([[2.0, 3.0, 1.0]])]), (2.0, 3.0, 3.0, 4.0))
+        self.assertRaises(Exception, find_area, [])
+        
+        clipped = clip_area(batches, area, 1.0)
+        self.assertTrue(-5.0 <= clipped[0] < -4.5 and 4.5 < clipped[2] <= 5.1)
+        self.assertTrue(-5.0 <= clipped[1] < -4.5 and 4.5 < clipped[3] <= 5.1)
+        self.assertTrue(60 < count_outside(points, clipped) <= 120)
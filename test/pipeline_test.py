@@ -0,0 +1,42 @@
+from pyheatmap.pipeline import render, accumulate
+from pyheatmap.mapcoords import normalize_coords
+from pyheatmap.heataccum import ArrayHeatGrid
+from pyheatmap.heatmap import Heatmap
+import numpy as np
+import random
+import unittest
+
+PALETTE = 'resources/palette.png'
+AREA = (10.0, 20.0, 30.0, 60.0)
+
+def randomPoints(n, seed=0):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(10.0, 30.0), rnd.uniform(20.0, 60.0), rnd.uniform(0.1, 2.0)) for _ in range(n)]
+
+#====================================================
+
+class PipelineTest(unittest.TestCase):
+    def stagedHeat(self, points, grid):
+        norm = list(normalize_coords([list(p) for p in points], AREA))
+        agrid = ArrayHeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=grid)
+        for p in norm:
+            agrid.insert(p)
+        items = agrid.items
+        top = max([w for _, _, w in items])
+        return [(x, y, w / top) for x, y, w in items]
+
+    def testAccumulateMatchesStages(self):
+        points = randomPoints(500)
+        batch = np.array([((x - 10.0) / 20.0, (y - 20.0) / 40.0, w) for x, y, w in points])
+        heat = accumulate([batch], grid=(9, 7))
+        expected = self.stagedHeat(points, (9, 7))
+
+        self.assertEqual(len(heat), len(expected))
+        self.assertTrue(np.allclose(heat, expected))
+        self.assertEqual(heat[:,2].max(), 1.0)
+
+    def testRenderMatchesStages(self):
+        points = randomPoints(500)
+        img = render(points, AREA, PALETTE, grid=(20, 20), size=(80, 60), dotsize=15)
+        expected = Heatmap().create(self.stagedHeat(points, (20, 20)), PALETTE, size=(80, 60), dotsize=15)
+        self.assertEqual(list(img.getdata()), list(expected.getdata()))
@@ -0,0 +1,144 @@
+from pyheatmap.pointio import *
+from StringIO import StringIO
+import numpy as np
+import unittest
+import mock
+import tempfile
+import os
+
+class PointIOTest(unittest.TestCase):
+    def read(self, text, **kwargs):
+        batches = list(read_stream(StringIO(text), **kwargs))
+        return np.concatenate(batches).tolist() if batches else []
+
+    def testReadStream(self):
+        self.assertEqual(self.read("1,2,0.5\n3,4\n 5 , 6 \n"),
+                         [[1, 2, 0.5], [3, 4, 1], [5, 6, 1]])
+        self.assertEqual(self.read("1,2\r\n3,4"), [[1, 2, 1], [3, 4, 1]])
+        self.assertEqual(self.read(""), [])
+
+    def testStopsAtEmptyLine(self):
+        self.assertEqual(self.read("1,2\n  \n3,4\n"), [[1, 2, 1]])
+        self.assertEqual(self.read("\n1,2\n"), [])
+
+    def testSmallBlocks(self):
+        text = ''.join('%d,%d,%d\n' % (i, i + 1, i + 2) for i in range(100))
+        batches = list(read_stream(StringIO(text), block_size=7))
+        self.assertGreater(len(batches), 1)
+        self.assertEqual(np.concatenate(batches).tolist(), [[i, i + 1, i + 2] for i in range(100)])
+
+    def testInvalidLength(self):
+        with self.assertRaisesRegexp(Exception, "Invalid data length at line 3: 5,6,7,8"):
+            self.read("1,2\n3,4\n5,6,7,8\n")
+        with self.assertRaisesRegexp(Exception, "Invalid data length at line 2: 3"):
+            self.read("1,2\n3\n")
+
+    def testInvalidValue(self):
+        with self.assertRaisesRegexp(Exception, "Invalid value at line 2: 3,abc"):
+            self.read("1,2\n3,abc\n")
+        with self.assertRaisesRegexp(Exception, "Invalid value at line 1: 1,"):
+            self.read("1,\n")
+
+    def testBatches(self):
+        points = [(0.1, 0.2), np.array([[0.3, 0.4], [0.5, 0.6]]), (0.7, 0.8, 0.5)]
+        res = np.concatenate(list(batches(points))).tolist()
+        self.assertEqual(res, [[0.1, 0.2, 1], [0.3, 0.4, 1], [0.5, 0.6, 1], [0.7, 0.8, 0.5]])
+        self.assertEqual(list(rows(points)), [(0.1, 0.2), (0.3, 0.4), (0.5, 0.6), (0.7, 0.8, 0.5)])
+
+    def testWriter(self):
+        s = StringIO()
+        with PointWriter(s, buffer_size=10) as out:
+            out.write(np.array([[0.1, 0.25, 1.0]]))
+            out.write([(1.0 / 3, 2, 3)])
+        self.assertEqual(s.getvalue(), "0.1,0.25,1.0\n0.333333333333,2,3\n")
+        self.assertEqual(self.read(s.getvalue())[0], [0.1, 0.25, 1.0])
+
+class BinaryFormatTest(unittest.TestCase):
+    points = np.array([[0.1, 0.2, 0.5], [0.3, 0.4, 1.0], [1.0 / 3, 0.6, 2.0]])
+
+    def encode(self, points, dtype='d', ncols=3):
+        s = StringIO()
+        with BinaryWriter(s, dtype, ncols) as out:
+            out.write(points)
+        return s.getvalue()
+
+    def testRoundTrip(self):
+        data = self.encode(self.points)
+        self.assertEqual(len(data), HEADER.size + 3 * 3 * 8)
+        res = np.concatenate(list(read_points(None, StringIO(data))))
+        self.assertEqual(res.tolist(), self.points.tolist())
+
+        res = np.concatenate(list(read_points(None, StringIO(self.encode(self.points, 'f')))))
+        self.assertTrue(np.allclose(res, self.points))
+        self.assertFalse((res == self.points).all())
+
+    def testMissingColumns(self):
+        data = self.encode([(0.1, 0.2), (0.3, 0.4)], ncols=2)
+        res = np.concatenate(list(read_points(None, StringIO(data))))
+        self.assertEqual(res.tolist(), [[0.1, 0.2, 1.0], [0.3, 0.4, 1.0]])
+
+    def testDetection(self):
+        res = np.concatenate(list(read_points(None, StringIO("1,2\n3,4\n"))))
+        self.assertEqual(res.tolist(), [[1, 2, 1], [3, 4, 1]])
+        self.assertRaises(Exception, lambda: list(read_points(None, StringIO("1,2\n"), format='bin')))
+        self.assertRaises(Exception, lambda: list(read_points(None, StringIO(self.encode(self.points)), format='csv')))
+
+    def testTruncated(self):
+        data = self.encode(self.points)
+        self.assertRaises(Exception, lambda: list(read_points(None, StringIO(data[:-3]))))
+        self.assertRaises(Exception, lambda: list(read_points(None, StringIO(data[:10]))))
+
+    def testMemoryMappedFile(self):
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.encode(self.points))
+            res = np.concatenate(list(read_points([fname])))
+            self.assertEqual(res.tolist(), self.points.tolist())
+            self.assertTrue(is_binary(fname))
+            self.assertFalse(is_binary(__file__))
+        finally:
+            os.remove(fname)
+
+    def testShards(self):
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(''.join('%d,%d\n' % (i, i) for i in range(1000)))
+            ranges = list(shards([fname], size=100))
+            self.assertGreater(len(ranges), 10)
+            res = np.concatenate([np.concatenate(list(read_shard(s))) for s in ranges])
+            self.assertEqual(res[:,0].tolist(), range(1000))
+
+            with open(fname, 'wb') as f:
+                f.write(self.encode(np.arange(300.0).reshape(100, 3)))
+            ranges = list(shards([fname], size=100))
+            self.assertEqual(len(ranges), 25)
+            res = np.concatenate([np.concatenate(list(read_shard(s))) for s in ranges])
+            self.assertEqual(res.ravel().tolist(), range(300))
+        finally:
+            os.remove(fname)
+
+    def testShardsMatchStream(self):
+        lines = ['%d,%d' % (i, i) for i in range(1000)]
+        fd, fname = tempfile.mkstemp()
+        try:
+            for broken, error in ((lines[:600] + [' \r'] + lines[600:], None),
+                                  (lines[:700] + ['7,x'] + lines[700:], 'line 701')):
+                with open(fname, 'wb') as f:
+                    f.write('\n'.join(broken) + '\n')
+                for block in (64, BLOCK_SIZE):
+                    with mock.patch('pyheatmap.pointio.BLOCK_SIZE', block):
+                        ranges = list(shards([fname], size=100))
+                        read = lambda: [np.concatenate(list(read_shard(s))) for s in ranges]
+                        if error:
+                            self.assertRaisesRegexp(Exception, error, read)
+                        else:
+                            self.assertEqual(np.concatenate(read())[:,0].tolist(), range(600))
+        finally:
+            os.remove(fname)
+
+    def testOpenWriter(self):
+        self.assertIsInstance(openWriter(StringIO(), 'csv'), PointWriter)
+        self.assertEqual(openWriter(StringIO(), 'bin32').dtype, 'f')
+        self.assertRaises(Exception, openWriter, StringIO(), 'xml')
@@ -0,0 +1,59 @@
+from pyheatmap.projections import *
+from pyheatmap.mapcoords import normalize_coords, normalize_batch, NORMALIZE_CHUNK
+import numpy as np
+import unittest
+import mock
+
+AREA = (-125.0, 24.0, -66.0, 50.0)
+
+def randomLonLat(n, seed=0):
+    rnd = np.random.RandomState(seed)
+    return np.column_stack((rnd.uniform(-125.0, -66.0, n), rnd.uniform(24.0, 50.0, n), np.ones(n)))
+
+#====================================================
+
+class ProjectionsTest(unittest.TestCase):
+    def testMercator(self):
+        m = createProjection('mercator')
+        xy = m.project(np.array([[180.0, MERCATOR_MAX_LAT], [0.0, 0.0], [-90.0, -90.0]]))
+        self.assertTrue(np.allclose(xy, [[20037508.34, 20037508.34], [0.0, 0.0], [-10018754.17, -20037508.34]]))
+    
+    def testNormalizerMatchesProjection(self):
+        for spec in ('mercator', 'equirect', 'equirect:40', 'affine:2,1,5,-1,3,0'):
+            projection = createProjection(spec)
+            points = randomLonLat(1000)
+            
+            fused = projection.normalizer(AREA)(points.copy())
+            staged = normalize_batch(projection.project(points.copy()), projection.bounds(AREA))
+            self.assertTrue(np.allclose(fused, staged, rtol=0.0, atol=1e-12))
+            self.assertTrue((fused[:,:2] >= -1e-12).all() and (fused[:,:2] <= 1.0 + 1e-12).all())
+            self.assertEqual(fused[:,2].tolist(), points[:,2].tolist())
+    
+    def testNormalizeCoords(self):
+        points = randomLonLat(50, seed=1)
+        projection = createProjection('mercator')
+        norm = list(normalize_coords(points.tolist(), AREA, projection))
+        self.assertTrue(np.allclose(norm, projection.normalizer(AREA)(points)))
+        
+        # input is consumed by chunks and outside points are reported once
+        points = randomLonLat(3 * NORMALIZE_CHUNK, seed=2)
+        points[:5, 0] = 0.0
+        consumed = []
+        def stream():
+            for p in points.tolist():
+                consumed.append(p)
+                yield p
+        
+        with mock.patch('sys.stderr') as stderr:
+            norm = normalize_coords(stream(), AREA, projection)
+            next(norm)
+            self.assertEqual(len(consumed), NORMALIZE_CHUNK)
+            rest = list(norm)
+        self.assertEqual(len(rest), len(points) - 1)
+        stderr.write.assert_called_once_with("5 of %d points fall outside of given area\n" % (len(points)))
+    
+    def testCreate(self):
+        self.assertEqual(createProjection('equirect:30').lat0, 30.0)
+        self.assertRaises(Exception, createProjection, 'lambert')
+        self.assertRaises(Exception, createProjection, 'affine:1,2')
+        self.assertRaises(Exception, createProjection, 'affine:1,2,0,2,4,0')
@@ -104,3 +104,53 @@ class QuedTreeTest(unittest.TestCase):
 
 
 
+    
+    def testQueryRect(self):
+        qt = QuadTree((0,0,1,1), max_items=2)
+        points = [(0.1,0.1), (0.2,0.3), (0.3,0.3), (0.6,0.2), (0.7,0.7), (0.9,0.9)]
+        for p in points:
+            qt.insert(p)
+        
+        self.assertListEqual(sorted(qt.query_rect((0.15,0.15,0.65,0.5))), [(0.2,0.3), (0.3,0.3), (0.6,0.2)])
+        self.assertListEqual(sorted(qt.query_rect((0,0,1,1))), points)
+        self.assertListEqual(list(qt.query_rect((2,2,3,3))), [])
+    
+    def testQueryRadius(self):
+        qt = QuadTree((0,0,1,1), max_items=2)
+        for p in [(0.1,0.1), (0.2,0.3), (0.3,0.3), (0.6,0.2), (0.7,0.7)]:
+            qt.insert(p)
+        
+        self.assertListEqual(sorted(qt.query_radius((0.25,0.3), 0.06)), [(0.2,0.3), (0.3,0.3)])
+        self.assertListEqual(list(qt.query_radius((0.95,0.05), 0.1)), [])
+    
+    def testNearest(self):
+        import random
+        rnd = random.Random(7)
+        points = [(rnd.random(), rnd.random()) for _ in range(500)]
+        qt = QuadTree((0,0,1,1), max_items=8)
+        for p in points:
+            qt.insert(p)
+        
+        q = (0.4, 0.6)
+        dist = lambda p: (p[0]-q[0])**2 + (p[1]-q[1])**2
+        self.assertListEqual(qt.nearest(q, 5), sorted(points, key=dist)[:5])
+        self.assertEqual(len(qt.nearest(q, 1000)), 500)
+    
+    def testBulkLoadMatchesInsertion(self):
+        import random
+        rnd = random.Random(11)
+        points = [(rnd.random(), rnd.random()) for _ in range(300)]
+        points += [(0.5, 0.5), (0.25, 0.75), (1.0, 1.0), (1.5, 0.5)] + points[:20]
+        
+        for params in [dict(max_items=4), dict(max_items=4, max_depth=3), dict(max_items=1, min_size=0.1)]:
+            qt = QuadTree((0,0,1,1), **params)
+            for p in points:
+                qt.insert(p)
+            
+            bulk = QuadTree.from_items(points, (0,0,1,1), **params)
+            self.assertEqual(str(bulk), str(qt))
+            self.assertEqual(bulk.count, qt.count)
+            self.assertEqual(bulk.depth, qt.depth)
+            
+            bulk.insert((0.3, 0.3))
+            self.assertEqual(bulk.count, qt.count + 1)
@@ -0,0 +1,107 @@
+from pyheatmap import stats
+from pyheatmap.partition.qtree import QuadTree
+from pyheatmap.partition.aqtree import ArrayQuadTree
+from pyheatmap.heataccum import HeatGrid, accumulate, accumulateFiles
+from pyheatmap import pointio
+import numpy as np
+import tempfile
+import random
+import mock
+import json
+import os
+import unittest
+
+def randomPoints(n, seed=0):
+    rnd = random.Random(seed)
+    return [(rnd.random(), rnd.random()) for _ in range(n)]
+
+#====================================================
+
+class StatsTest(unittest.TestCase):
+    def tearDown(self):
+        stats.disable()
+    
+    def testDisabled(self):
+        self.assertFalse(stats.enabled())
+        batches = [np.zeros((3, 3))]
+        self.assertTrue(stats.iterate('read', batches) is batches)
+        with stats.stage('insert'):
+            stats.count('points', 3)
+        self.assertEqual(stats.report(), {})
+    
+    def testStages(self):
+        collected = stats.enable()
+        for _ in range(3):
+            with stats.stage('insert'):
+                stats.count('cells', 2)
+        
+        self.assertEqual(collected.stages['insert']['calls'], 3)
+        self.assertTrue(collected.stages['insert']['peak_rss_mb'] > 0)
+        self.assertEqual(collected.counters['cells'], 6)
+        
+        grid = accumulate([np.array([[0.5, 0.5, 1.0]] * 10)] * 4, cells_num=(4,4))
+        self.assertEqual(grid.cellSums()[1][0,2], 40.0)
+        self.assertEqual(collected.counters['points'], 40)
+        self.assertEqual(collected.stages['read']['calls'], 5)
+        self.assertEqual(collected.stages['insert']['calls'], 7)
+        self.assertEqual(collected.counters['cells_touched'], 4)
+        
+        grid = HeatGrid((0,0,1,1), lambda x: (x[0],x[1]), cells_num=(4,4))
+        with stats.stage('insert'):
+            for p in [(0.1, 0.1, 1.0), (0.1, 0.1, 1.0), (0.9, 0.9, 1.0), (1.5, 0.5, 1.0)]:
+                grid.insert(p)
+        self.assertEqual(collected.stages['insert']['calls'], 8)
+        self.assertEqual(collected.counters['cells_touched'], 7)
+        
+        fd, fname = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            stats.save(fname)
+            with open(fname) as f:
+                self.assertEqual(json.load(f)['counters'], {'cells' : 6, 'points' : 40, 'cells_touched' : 7})
+        finally:
+            os.remove(fname)
+    
+    def testWorkerStats(self):
+        # all points fall into one cell, every shard touches it once
+        points = np.array([(x * 0.02, y * 0.02, 1.0) for x, y in randomPoints(3000)])
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pointio.BinaryWriter(f).write(points)
+            
+            reports = []
+            with mock.patch.object(pointio, 'SHARD_SIZE', 4000):
+                shards = len(list(pointio.shards([fname])))
+                for workers in (1, 3):
+                    collected = stats.enable()
+                    accumulateFiles([fname], cells_num=(40,30), workers=workers)
+                    reports.append(collected)
+            
+            single, multi = reports
+            self.assertEqual(multi.counters, single.counters)
+            self.assertEqual(multi.counters['points'], 3000)
+            self.assertEqual(multi.counters['cells_touched'], shards)
+            self.assertTrue(shards > 5)
+            for name in ('read', 'insert', 'merge'):
+                self.assertEqual(multi.stages[name]['calls'], single.stages[name]['calls'])
+        finally:
+            os.remove(fname)
+    
+    def testTreeSplitsAndMerges(self):
+        points = randomPoints(500)
+        for cls in (QuadTree, ArrayQuadTree):
+            collected = stats.enable()
+            qt = cls((0,0,1,1), max_items=8, min_items=4)
+            for p in points:
+                qt.insert(p)
+            splits = collected.counters['qtree_splits']
+            self.assertTrue(splits > 0)
+            
+            for p in points:
+                qt.remove(p)
+            self.assertTrue(0 < collected.counters['qtree_merges'] <= splits)
+            
+            collected = stats.enable()
+            cls.from_items(points, (0,0,1,1), max_items=8)
+            self.assertEqual(collected.counters['qtree_splits'], splits)
@@ -0,0 +1,49 @@
+from pyheatmap.tiles import TileRenderer
+from pyheatmap.heatmap import Heatmap
+import numpy as np
+import random
+import shutil
+import tempfile
+import os
+import unittest
+
+PALETTE = 'resources/palette.png'
+
+#====================================================
+
+class TileRendererTest(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        self.points = [(rnd.uniform(-0.05, 0.6), rnd.uniform(0.4, 1.05), rnd.random()) for _ in range(200)]
+        self.renderer = TileRenderer(self.points, PALETTE, dotsize=21, tile_size=32)
+
+    def testTilesAreSeamless(self):
+        hm = Heatmap()
+        hm.points = self.points
+        hm.size = (128, 128)
+        hm.scale = None
+        whole = np.asarray(hm._buildMaskArray(hm._buildDot(21)))
+
+        stitched = np.zeros((128, 128), np.uint8)
+        for tx, ty in self.renderer.tiles(2):
+            mask = self.renderer.tileMask(2, tx, ty)
+            if mask is not None:
+                stitched[ty*32:(ty+1)*32, tx*32:(tx+1)*32] = mask
+
+        self.assertTrue((stitched == whole).all())
+
+    def testEmptyTilesAreSkipped(self):
+        tiles = self.renderer.tiles(2)
+        self.assertNotIn((3, 3), tiles)
+        self.assertIn((0, 0), tiles)
+        self.assertIsNone(self.renderer.tileMask(2, 3, 3))
+
+    def testRenderPyramid(self):
+        outdir = tempfile.mkdtemp()
+        try:
+            written = self.renderer.renderPyramid(outdir, range(3))
+            self.assertTrue(os.path.isfile(os.path.join(outdir, '0', '0', '0.png')))
+            self.assertFalse(os.path.exists(os.path.join(outdir, '2', '3', '3.png')))
+            self.assertEqual(written, sum(len(files) for _, _, files in os.walk(outdir)))
+        finally:
+            shutil.rmtree(outdir)